@@ -0,0 +1,174 @@
+"""
+Answers a JSONL file of user queries without the Streamlit UI.
+
+Every input line is a JSON object with a "query" and optional "id" and "session" fields, or a bare JSON string.
+Lines that share a session are answered in order by the same bot so follow up questions keep their conversation
+state, everything else is answered concurrently (at most --concurrency at a time) over the shared clients and caches.
+Answers and per query stage timings are written as JSONL in completion order.
+
+    python batch.py queries.jsonl --output answers.jsonl --concurrency 8
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import contextlib
+
+from weather_core import WeatherBot, get_weather_client_manager, get_openai_client_manager, get_forecast_store, \
+    get_metrics
+
+
+def read_queries(path):
+    with (sys.stdin if path == '-' else open(path)) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, None, f'invalid JSON ({e.msg})'
+                continue
+            if isinstance(record, str):
+                record = {"query": record}
+            if not isinstance(record, dict) or not isinstance(record.get("query"), str):
+                yield line_number, None, 'expected a string or an object with a "query" string'
+                continue
+            yield line_number, record, None
+
+
+class BatchRunner:
+    """
+    Bounded concurrency over one bot per session, plus a pool of reusable bots for the session-less queries.
+    """
+    def __init__(self, concurrency, make_bot, write):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.make_bot = make_bot
+        self.write = write
+        self.sessions = {}
+        self.idle_bots = []
+        self.answered = 0
+        self.errors = 0
+
+    def session(self, session_id):
+        if session_id not in self.sessions:
+            self.sessions[session_id] = (self.make_bot(), {}, asyncio.Lock())
+        return self.sessions[session_id]
+
+    async def answer(self, line_number, record):
+        try:
+            session_id = record.get("session")
+            if session_id is None:
+                bot = self.idle_bots.pop() if self.idle_bots else self.make_bot()
+                try:
+                    result = await bot.answer(record["query"], {})
+                finally:
+                    # a pooled bot starts the next query from an empty state, the last reply template included
+                    bot.parsed_query_data = dict(bot.reset_conversation_state(), response="")
+                    bot.terminate = False
+                    self.idle_bots.append(bot)
+            else:
+                bot, state, lock = self.session(session_id)
+                async with lock:
+                    result = await bot.answer(record["query"], state)
+            self.emit(line_number, record, result)
+        except Exception as e:
+            self.emit(line_number, record, {"error": f'{type(e).__name__}: {e}'})
+        finally:
+            self.semaphore.release()
+
+    def emit(self, line_number, record, result):
+        self.answered += 1
+        if result.get("error"):
+            self.errors += 1
+        parsed_query_data = result.get("parsed_query_data") or {}
+        self.write({
+            "line": line_number,
+            "id": record.get("id", line_number),
+            "session": record.get("session"),
+            "query": record["query"],
+            "reply": result.get("reply"),
+            "intent": parsed_query_data.get("intent"),
+            "locations": parsed_query_data.get("locations"),
+            "error": result.get("error"),
+            "timings_ms": result.get("timings_ms", {})
+        })
+
+    async def run(self, queries):
+        tasks = set()
+        for line_number, record, problem in queries:
+            if problem is not None:
+                self.answered += 1
+                self.errors += 1
+                self.write({"line": line_number, "error": problem})
+                continue
+            # reading only runs ahead of the answers by the concurrency limit
+            await self.semaphore.acquire()
+            task = asyncio.ensure_future(self.answer(line_number, record))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+async def run_batch(args, out):
+    weather_client = get_weather_client_manager()
+    gpt_client = get_openai_client_manager(args.openai_api_key)
+    forecast_store = get_forecast_store(args.forecast_store) if args.forecast_store else None
+    metrics = get_metrics(enabled=True) if args.metrics else None
+    if args.weather_base_url:
+        weather_client.base_url = args.weather_base_url.rstrip('/')
+    if args.openai_base_url:
+        gpt_client.base_url = args.openai_base_url
+
+    def make_bot():
+        return WeatherBot(openai_api_key=args.openai_api_key, weather_client=weather_client, gpt_client=gpt_client,
+                          model=args.model, request_budget_seconds=args.budget, forecast_store=forecast_store,
+                          metrics=metrics)
+
+    def write(row):
+        out.write(json.dumps(row, ensure_ascii=False, default=str) + '\n')
+        out.flush()
+
+    runner = BatchRunner(args.concurrency, make_bot, write)
+    await runner.run(read_queries(args.queries))
+    if metrics is not None:
+        with open(args.metrics, 'w') as f:
+            json.dump(metrics.snapshot(), f, indent=2, default=str)
+    return runner
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('queries', help="JSONL file of queries, '-' reads stdin")
+    parser.add_argument('--output', default='-', help="where to write the JSONL answers, '-' is stdout")
+    parser.add_argument('--concurrency', type=int, default=8, help='queries answered at the same time')
+    parser.add_argument('--model', default='gpt-4o')
+    parser.add_argument('--budget', type=float, default=20, help='time budget per query in seconds')
+    parser.add_argument('--openai-api-key', default=os.environ.get('OPENAI_API_KEY'),
+                        help='defaults to $OPENAI_API_KEY')
+    parser.add_argument('--openai-base-url', help='OpenAI compatible endpoint, e.g. a local stand-in')
+    parser.add_argument('--weather-base-url', help='wttr.in compatible endpoint, e.g. a local stand-in')
+    parser.add_argument('--forecast-store', help='SQLite file shared with other workers, '
+                                                   'defaults to $WEATHER_BOT_FORECAST_STORE')
+    parser.add_argument('--metrics', help='write the stage latency, token and cache metrics as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help="print the bot's own diagnostics to stderr")
+    args = parser.parse_args(argv)
+    if args.concurrency < 1:
+        parser.error('--concurrency must be at least 1')
+
+    start = time.perf_counter()
+    with (sys.stdout if args.output == '-' else open(args.output, 'w')) as out:
+        # the bot prints its diagnostics, keep them out of the JSONL on stdout
+        with (contextlib.nullcontext(sys.stderr) if args.verbose else open(os.devnull, 'w')) as diagnostics, \
+                contextlib.redirect_stdout(diagnostics):
+            runner = asyncio.run(run_batch(args, out))
+    seconds = time.perf_counter() - start
+    print(f'{runner.answered} queries in {seconds:.1f}s ({runner.answered / seconds:.1f} q/s), '
+          f'{runner.errors} errors', file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
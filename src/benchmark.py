@@ -0,0 +1,373 @@
+"""
+Offline benchmark of the WeatherBot request pipeline.
+
+Drives WeatherBot.answer(), the request path the UI and batch.py use (local parser, query cache, location
+prefetch, slot filling, get_weather and construct_reply), against local stand-ins for the OpenAI chat completions
+API, wttr.in and Giphy, with configurable latency and canned payloads. No paid or live service is called.
+
+    python benchmark.py --sessions 1 8 32 --rounds 3 --openai-latency 800 --weather-latency 300
+
+Results (per stage p50/p95/p99, throughput per concurrency level, peak memory) are written as JSON to --output
+so runs can be compared.
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tracemalloc
+import zlib
+import contextlib
+from datetime import datetime, timedelta
+from urllib.parse import unquote_plus
+
+from aiohttp import web
+
+from refresher import HotLocationRefresher
+from resilience import SingleFlight
+from weather_core import WeatherBot, BackgroundLoop, WeatherClientManager, OpenAIClientManager, ConditionGifs
+
+
+# the sample questions listed at the bottom of weather_bot.py
+SAMPLE_QUESTIONS = [
+    "What is the local time in berlin?",
+    "What is the weather going to be like in austin texas tomorrow? Also, what is the wind speed?",
+    "What is the humidity level in berlin today?",
+    "When will the moon rise today in berlin?",
+    "What is the average temperature in London tomorrow?",
+    "Is there a full moon tonight in berlin ?",
+    "Will it snow tomorrow afternoon in Berlin, Germany?",
+    "What will be the heat and uv index today at noon in berlin?",
+    "What will the weather be like monday at around noon in nyc?",
+    "Compare the temperature in Berlin and London tomorrow",
+    "Thank you so much, all done good bye",
+]
+# follow ups that answer the bot's question for a missing slot, Springfield is not in the gazetteer so its answer
+# goes to the slot filling prompt
+SAMPLE_CONVERSATIONS = [[question] for question in SAMPLE_QUESTIONS] + [
+    ["What will the temperature be tomorrow?", "Berlin"],
+    ["Will it rain tomorrow afternoon?", "Springfield"],
+]
+
+# the stages WeatherBot.answer() times
+STAGES = ['understand_query', 'get_weather', 'construct_reply', 'total']
+
+WEATHER_CODES = [113, 116, 119, 122, 143, 176, 200, 227, 266, 302, 335, 389]
+WIND_POINTS = ['N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE', 'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW']
+MOON_PHASES = ['New Moon', 'Waxing Crescent', 'First Quarter', 'Waxing Gibbous', 'Full Moon', 'Waning Gibbous',
+               'Last Quarter', 'Waning Crescent']
+
+
+def wttr_payload(location, today):
+    """
+    Synthetic wttr.in ?format=j1 payload with every field python_weather reads, deterministic per location.
+    """
+    rng = random.Random(zlib.crc32(location.lower().encode()))
+
+    def conditions(temperature):
+        code = rng.choice(WEATHER_CODES)
+        direction = rng.randrange(16)
+        return {
+            "FeelsLikeC": str(temperature - rng.randint(0, 3)), "FeelsLikeF": str(int(temperature * 1.8 + 30)),
+            "humidity": str(rng.randint(30, 95)),
+            "precipMM": f"{rng.random() * 4:.1f}", "precipInches": f"{rng.random() / 6:.1f}",
+            "pressure": str(rng.randint(995, 1030)), "pressureInches": str(rng.randint(29, 31)),
+            "visibility": str(rng.randint(5, 10)), "visibilityMiles": str(rng.randint(3, 6)),
+            "windspeedKmph": str(rng.randint(0, 40)), "windspeedMiles": str(rng.randint(0, 25)),
+            "winddir16Point": WIND_POINTS[direction], "winddirDegree": str(direction * 22),
+            "weatherCode": str(code), "weatherDesc": [{"value": f"Condition {code}"}],
+            "uvIndex": str(rng.randint(0, 9)),
+        }
+
+    current = conditions(rng.randint(-5, 30))
+    current.update({"temp_C": str(rng.randint(-5, 30)), "temp_F": str(rng.randint(23, 86)),
+                    "localObsDateTime": today.strftime('%Y-%m-%d %I:%M %p')})
+    days = []
+    for day in range(3):
+        hourly = []
+        for slot in range(8):
+            temperature = rng.randint(-5, 30)
+            hour = conditions(temperature)
+            hour.update({
+                "time": str(slot * 300), "tempC": str(temperature), "tempF": str(int(temperature * 1.8 + 32)),
+                "DewPointC": str(temperature - 5), "DewPointF": str(int(temperature * 1.8 + 23)),
+                "HeatIndexC": str(temperature + 1), "HeatIndexF": str(int(temperature * 1.8 + 34)),
+                "WindChillC": str(temperature - 2), "WindChillF": str(int(temperature * 1.8 + 28)),
+                "WindGustKmph": str(rng.randint(5, 60)), "WindGustMiles": str(rng.randint(3, 38)),
+                "cloudcover": str(rng.randint(0, 100)),
+            })
+            for chance in ('fog', 'frost', 'hightemp', 'overcast', 'rain', 'remdry', 'snow', 'sunshine', 'thunder',
+                           'windy'):
+                hour[f'chanceof{chance}'] = str(rng.randint(0, 100))
+            hourly.append(hour)
+        days.append({
+            "date": (today + timedelta(days=day)).strftime('%Y-%m-%d'),
+            "maxtempC": str(rng.randint(15, 30)), "maxtempF": str(rng.randint(59, 86)),
+            "mintempC": str(rng.randint(-5, 14)), "mintempF": str(rng.randint(23, 57)),
+            "avgtempC": str(rng.randint(5, 20)), "avgtempF": str(rng.randint(41, 68)),
+            "sunHour": f"{rng.uniform(2, 14):.1f}", "totalSnow_cm": f"{rng.random():.1f}",
+            "astronomy": [{"moon_illumination": str(rng.randint(0, 100)), "moon_phase": rng.choice(MOON_PHASES),
+                           "moonrise": "07:41 PM", "moonset": "06:02 AM",
+                           "sunrise": "06:12 AM", "sunset": "08:47 PM"}],
+            "hourly": hourly,
+        })
+    return {
+        "current_condition": [current],
+        "nearest_area": [{"areaName": [{"value": location.title()}], "country": [{"value": "Benchland"}],
+                          "region": [{"value": "Offline"}], "population": str(rng.randint(1000, 9000000)),
+                          "latitude": f"{rng.uniform(-80, 80):.3f}", "longitude": f"{rng.uniform(-170, 170):.3f}"}],
+        "request": [{"query": location, "type": "City"}],
+        "weather": days,
+    }
+
+
+class StandInServers:
+    """
+    Local HTTP stand-ins for api.openai.com, wttr.in and the Giphy search on their own event loop thread.
+    """
+    def __init__(self, bot_for_replies, openai_latency, weather_latency, jitter, openai_fixture=None):
+        self.bot = bot_for_replies
+        self.openai_latency = openai_latency
+        self.weather_latency = weather_latency
+        self.jitter = jitter
+        self.openai_fixture = openai_fixture or {}
+        self.loop = BackgroundLoop(name='benchmark-stand-ins')
+        self.requests = {'openai': 0, 'weather': 0, 'giphy': 0}
+        self.port = None
+
+    async def delay(self, latency):
+        await asyncio.sleep(max(0.0, latency + random.uniform(-self.jitter, self.jitter)))
+
+    def canned_reply(self, user_input):
+        if user_input in self.openai_fixture:
+            return self.openai_fixture[user_input]
+        parsed = self.bot.query_parser.parse(user_input, self.bot.todays_date)
+        if parsed is None:
+            # a weather question without a place, the bot asks for it like it would after the model's reply
+            filled = self.bot.slot_filler.parse('ontology_labels', user_input, self.bot.reset_conversation_state(),
+                                                self.bot.todays_date, lambda location: True)
+            if filled is not None and 'location' not in filled:
+                state = dict(self.bot.reset_conversation_state(), intent='get_weather', response='')
+                parsed = self.bot.slot_filler.merge(state, filled)
+        if parsed is None:
+            parsed = dict(self.bot.reset_conversation_state(), intent='unknown',
+                          response="Sorry, I can only help with weather questions.")
+        return parsed
+
+    def canned_slot(self, slot, user_input):
+        filled = self.bot.slot_filler.parse(slot, user_input, self.bot.reset_conversation_state(),
+                                            self.bot.todays_date, lambda location: True)
+        unanswered = [] if slot == 'ontology_labels' else ''
+        return {"answered": filled is not None, "value": filled[slot] if filled else unanswered}
+
+    async def chat_completions(self, request):
+        self.requests['openai'] += 1
+        body = await request.json()
+        prompt = body['messages'][-1]['content']
+        user_input = json.loads(prompt[prompt.index('User input: ') + len('User input: '):].splitlines()[0])
+        schema_name = body.get('response_format', {}).get('json_schema', {}).get('name', '')
+        await self.delay(self.openai_latency)
+        if schema_name.startswith('slot_'):
+            content = json.dumps(self.canned_slot(schema_name[len('slot_'):], user_input))
+        else:
+            content = json.dumps(self.canned_reply(user_input))
+        # the whole prompt, the static system prefix included
+        prompt_length = sum(len(message['content']) for message in body['messages'])
+        return web.json_response({
+            "id": "chatcmpl-benchmark", "object": "chat.completion", "created": int(time.time()),
+            "model": body['model'],
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_length // 4, "completion_tokens": len(content) // 4,
+                      "total_tokens": (prompt_length + len(content)) // 4}
+        })
+
+    async def wttr(self, request):
+        self.requests['weather'] += 1
+        await self.delay(self.weather_latency)
+        return web.json_response(wttr_payload(unquote_plus(request.match_info['location']), datetime.now()))
+
+    async def gifs_search(self, request):
+        self.requests['giphy'] += 1
+        await self.delay(self.weather_latency)
+        slug = '-'.join(request.query['q'].split())
+        return web.json_response({"data": [{"images": {"fixed_height": {"url": f'https://media.example/{slug}.gif'}}}]})
+
+    async def _start(self):
+        app = web.Application()
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+        app.router.add_get('/v1/gifs/search', self.gifs_search)
+        app.router.add_get('/{location}', self.wttr)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, '127.0.0.1', 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    def start(self):
+        self.loop.submit(self._start()).result(10)
+        return f'http://127.0.0.1:{self.port}'
+
+    def stop(self):
+        self.loop.submit(self.runner.cleanup()).result(10)
+        self.loop.stop()
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples):
+    return {
+        "count": len(samples),
+        "mean_ms": 1000 * sum(samples) / len(samples) if samples else None,
+        "p50_ms": None if not samples else 1000 * percentile(samples, 0.50),
+        "p95_ms": None if not samples else 1000 * percentile(samples, 0.95),
+        "p99_ms": None if not samples else 1000 * percentile(samples, 0.99),
+    }
+
+
+async def run_conversation(bot, turns, timings):
+    # every conversation starts from an empty state, like a new user of a pooled bot
+    bot.parsed_query_data = dict(bot.reset_conversation_state(), response="")
+    bot.terminate = False
+    session = {}
+    errors = []
+    for turn in turns:
+        result = await bot.answer(turn, session)
+        for stage in STAGES:
+            if stage in result['timings_ms']:
+                timings[stage].append(result['timings_ms'][stage] / 1000)
+        if result['error'] is not None:
+            errors.append(result['error'])
+    return errors
+
+
+async def run_level(sessions, rounds, conversations, make_bot, cold):
+    timings = {stage: [] for stage in STAGES}
+    errors = []
+
+    async def session(index):
+        bot = make_bot()
+        for round_index in range(rounds):
+            for offset in range(len(conversations)):
+                # every session walks the conversations from a different offset so upstream calls interleave
+                turns = conversations[(offset + index) % len(conversations)]
+                if cold:
+                    bot.forecast_cache.clear()
+                try:
+                    errors.extend(await run_conversation(bot, turns, timings))
+                except Exception as e:
+                    errors.append(f'{type(e).__name__}: {e}')
+
+    start = time.perf_counter()
+    await asyncio.gather(*(session(index) for index in range(sessions)))
+    wall_seconds = time.perf_counter() - start
+    queries = len(timings['total'])
+    return {
+        "sessions": sessions,
+        "queries": queries,
+        "errors": len(errors),
+        "error_samples": errors[:5],
+        "wall_seconds": wall_seconds,
+        "throughput_qps": queries / wall_seconds if wall_seconds else None,
+        "stages": {stage: summarize(samples) for stage, samples in timings.items()},
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sessions', type=int, nargs='+', default=[1, 8, 32],
+                        help='concurrent session counts to measure')
+    parser.add_argument('--rounds', type=int, default=3, help='passes over the question list per session')
+    parser.add_argument('--openai-latency', type=float, default=800, help='stand-in completion latency in ms')
+    parser.add_argument('--weather-latency', type=float, default=300, help='stand-in wttr.in latency in ms')
+    parser.add_argument('--jitter', type=float, default=50, help='uniform +/- latency jitter in ms')
+    parser.add_argument('--questions', help='file with one conversation per line, its turns separated by " | ", '
+                                            'defaults to the sample conversations')
+    parser.add_argument('--openai-fixture', help='JSON object mapping a question to the canned parsed reply')
+    parser.add_argument('--cold', action='store_true', help='clear the forecast cache before every query')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='also report the tracemalloc peak (slows the pipeline down)')
+    parser.add_argument('--verbose', action='store_true', help="keep the bot's own diagnostic prints")
+    parser.add_argument('--output', default='benchmark_results.json', help='where to write the JSON results')
+    args = parser.parse_args(argv)
+
+    conversations = SAMPLE_CONVERSATIONS
+    if args.questions:
+        with open(args.questions) as f:
+            conversations = [[turn.strip() for turn in line.split(' | ')] for line in f if line.strip()]
+    openai_fixture = None
+    if args.openai_fixture:
+        with open(args.openai_fixture) as f:
+            openai_fixture = json.load(f)
+
+    background_loop = BackgroundLoop()
+    weather_client = WeatherClientManager(background_loop)
+    gpt_client = OpenAIClientManager(background_loop, api_key='benchmark')
+
+    single_flight = SingleFlight(background_loop)
+    # measures the request path itself, no background refreshes in between
+    refresher = HotLocationRefresher(background_loop, top_n=0)
+    condition_gifs = ConditionGifs(background_loop, 'benchmark', single_flight)
+
+    def make_bot():
+        # caches, stats and upstreams are the process wide instances, shared by every session
+        return WeatherBot(openai_api_key='benchmark', giphy_api_key='benchmark',
+                          weather_client=weather_client, gpt_client=gpt_client, single_flight=single_flight,
+                          refresher=refresher, condition_gifs=condition_gifs)
+
+    servers = StandInServers(make_bot(), args.openai_latency / 1000, args.weather_latency / 1000,
+                             args.jitter / 1000, openai_fixture)
+    base_url = servers.start()
+    weather_client.base_url = base_url
+    gpt_client.base_url = f'{base_url}/v1'
+    condition_gifs.base_url = f'{base_url}/v1/gifs/search'
+
+    results = {
+        "started_at": datetime.now().isoformat(timespec='seconds'),
+        "python": sys.version.split()[0],
+        "config": {key: value for key, value in vars(args).items() if key != 'output'},
+        "conversations": conversations,
+        "levels": [],
+    }
+    try:
+        for sessions in args.sessions:
+            if args.trace_memory:
+                tracemalloc.start()
+            with (contextlib.nullcontext(sys.stdout) if args.verbose else open(os.devnull, 'w')) as diagnostics, \
+                    contextlib.redirect_stdout(diagnostics):
+                level = asyncio.run(run_level(sessions, args.rounds, conversations, make_bot, args.cold))
+            if args.trace_memory:
+                level["tracemalloc_peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+                tracemalloc.stop()
+            # ru_maxrss is in KiB on Linux and bytes on macOS
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            level["peak_rss_mb"] = max_rss / (2 ** 20 if sys.platform == 'darwin' else 2 ** 10)
+            results["levels"].append(level)
+            total = level["stages"]["total"]
+            print(f'{sessions:>4} sessions: {level["throughput_qps"]:.1f} q/s, total p50 {total["p50_ms"]:.0f} ms, '
+                  f'p95 {total["p95_ms"]:.0f} ms, p99 {total["p99_ms"]:.0f} ms, errors {level["errors"]}')
+    finally:
+        results["upstream_requests"] = dict(servers.requests)
+        results["forecast_cache"] = make_bot().forecast_cache.stats()
+        results["single_flight"] = single_flight.stats()
+        results["condition_gifs"] = condition_gifs.stats()
+        servers.stop()
+        weather_client.close()
+        gpt_client.close()
+        condition_gifs.close()
+        background_loop.stop()
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results written to {os.path.abspath(args.output)}')
+
+
+if __name__ == "__main__":
+    main()
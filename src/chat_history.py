@@ -0,0 +1,35 @@
+from collections import deque
+
+
+HISTORY_MAX_TURNS = 200
+HISTORY_PAGE_SIZE = 10
+
+
+class ChatHistory:
+    """
+    The last max_turns (user input, bot reply, weather condition) turns of one conversation, the oldest are dropped as new ones arrive
+    so a long session keeps a fixed footprint. Every turn keeps its sequence number, a stable widget key however
+    many turns were dropped before it.
+    """
+    def __init__(self, max_turns=HISTORY_MAX_TURNS):
+        self.turns = deque(maxlen=max_turns)
+        self.total = 0
+
+    def append(self, user_input, bot_response, condition=None):
+        # the condition, not its GIF url, is kept: the url is looked up in the shared cache when rendered
+        self.turns.append((self.total, user_input, bot_response, condition))
+        self.total += 1
+
+    def __len__(self):
+        return len(self.turns)
+
+    @property
+    def dropped(self):
+        return self.total - len(self.turns)
+
+    def latest(self, count):
+        """
+        Up to count of the most recent turns, newest first, without copying the rest.
+        """
+        count = min(count, len(self.turns))
+        return [self.turns[-index] for index in range(1, count + 1)]
@@ -0,0 +1,124 @@
+import json
+import time
+import zlib
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from forecast_view import FlatForecast, flatten_forecast
+
+
+FORECAST_STORE_MAX_BYTES = 64 * 2 ** 20
+# compaction runs after this many writes, expired rows are skipped by reads in between
+FORECAST_STORE_COMPACT_EVERY = 100
+
+
+class ForecastStore:
+    """
+    Forecasts shared by every process on the host through one SQLite file in WAL mode, so concurrent
+    Streamlit workers read while one of them writes. Rows hold the flattened values (flatten_forecast)
+    as zlib compressed json, keyed by the forecast cache key, and survive restarts and redeploys.
+    Expired rows are deleted and the oldest fetches dropped once the payloads exceed max_bytes.
+    """
+    def __init__(self, path, ttl_seconds=600, max_bytes=FORECAST_STORE_MAX_BYTES,
+                 compact_every=FORECAST_STORE_COMPACT_EVERY):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.compact_every = compact_every
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # one writer thread, so writes never wait on each other's sqlite lock and never block a reply
+        self._writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='forecast-store')
+        self.writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.compactions = 0
+        with self.connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS forecasts (key TEXT PRIMARY KEY, fetched_at REAL NOT NULL, '
+                               'expires_at REAL NOT NULL, size INTEGER NOT NULL, payload BLOB NOT NULL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS forecasts_fetched_at ON forecasts (fetched_at)')
+
+    def connection(self):
+        # sqlite connections can not be shared between threads, every Streamlit session thread gets its own
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            # auto_vacuum only applies to a new database file, it lets compaction hand space back to the OS
+            connection.execute('PRAGMA auto_vacuum=INCREMENTAL')
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def encode_key(key):
+        return json.dumps(key, separators=(',', ':'))
+
+    def get(self, key):
+        row = self.connection().execute('SELECT fetched_at, payload FROM forecasts WHERE key = ? AND expires_at > ?',
+                                        (self.encode_key(key), time.time())).fetchone()
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        fetched_at, payload = row
+        return FlatForecast(json.loads(zlib.decompress(payload)), fetched_at)
+
+    def put(self, key, flat, fetched_at=None):
+        fetched_at = fetched_at or time.time()
+        payload = zlib.compress(json.dumps(flat, separators=(',', ':')).encode(), 6)
+        self.connection().execute('INSERT OR REPLACE INTO forecasts VALUES (?, ?, ?, ?, ?)',
+                                  (self.encode_key(key), fetched_at, fetched_at + self.ttl_seconds, len(payload),
+                                   payload))
+        with self._lock:
+            self.writes += 1
+            compact = self.writes % self.compact_every == 0
+        if compact:
+            self.compact()
+
+    def save_in_background(self, key, weather, fetched_at=None):
+        def save():
+            try:
+                self.put(key, flatten_forecast(weather), fetched_at)
+            except Exception as e:
+                print(f"Error saving forecast to {self.path}: {type(e).__name__} - {e}")
+        return self._writer.submit(save)
+
+    def close(self):
+        self._writer.shutdown(wait=True)
+
+    def compact(self):
+        connection = self.connection()
+        connection.execute('DELETE FROM forecasts WHERE expires_at <= ?', (time.time(),))
+        total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM forecasts').fetchone()[0]
+        if total > self.max_bytes:
+            # drop the oldest fetches until the payloads fit again
+            cutoff = 0
+            rows = connection.execute('SELECT fetched_at, size FROM forecasts ORDER BY fetched_at DESC').fetchall()
+            for fetched_at, size in rows:
+                cutoff += size
+                if cutoff > self.max_bytes:
+                    connection.execute('DELETE FROM forecasts WHERE fetched_at <= ?', (fetched_at,))
+                    break
+        connection.execute('PRAGMA incremental_vacuum')
+        connection.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        with self._lock:
+            self.compactions += 1
+
+    def stats(self):
+        entries, size = self.connection().execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM forecasts').fetchone()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": self.path,
+                "entries": entries,
+                "payload_bytes": size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "writes": self.writes,
+                "compactions": self.compactions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
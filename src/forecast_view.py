@@ -0,0 +1,389 @@
+import math
+import operator
+import importlib
+
+
+def format_time(value):
+    return value.strftime("%H:%M:%S") if value else "N/A"
+
+
+# one extractor per ontology datapoint, shared by the lazy lookups and the full materialization
+GENERAL_FIELDS = {
+    "coordinates": lambda weather: weather.coordinates,
+    "country": lambda weather: weather.country,
+    "local_datetime": lambda weather: format_time(weather.datetime),
+    "current_forecast_description": lambda weather: weather.description,
+    "feels_like": lambda weather: weather.feels_like,
+    "humidity": lambda weather: weather.humidity,
+    "forecast_kind": lambda weather: weather.kind.name,
+    "forecast_kind_emoji": lambda weather: weather.kind.emoji,
+    "forecast_kind_value": lambda weather: weather.kind.value,
+    "local_population": lambda weather: weather.local_population,
+    "language": lambda weather: weather.locale,
+    "location": lambda weather: weather.location,
+    "precipitation": lambda weather: weather.precipitation,
+    "pressure": lambda weather: weather.pressure,
+    "region": lambda weather: weather.region,
+    "temperature": lambda weather: weather.temperature,
+    "uv_index": lambda weather: weather.ultraviolet.index,
+    "uv_rate": lambda weather: weather.ultraviolet.name,
+    "forecast_unit_object": lambda weather: weather.unit,
+    "visibility": lambda weather: weather.visibility,
+    "wind_direction_degrees": lambda weather: weather.wind_direction.degrees,
+    "wind_direction_emoji": lambda weather: weather.wind_direction.emoji,
+    "wind_cardinal_direction": lambda weather: weather.wind_direction.name,
+    "wind_direction_abbr": lambda weather: weather.wind_direction.value,
+    "wind_speed": lambda weather: weather.wind_speed
+}
+
+DAILY_FIELDS = {
+    "date": lambda daily: daily.date,
+    "highest_temperature": lambda daily: daily.highest_temperature,
+    "hourly_forecast_generator": lambda daily: daily.hourly_forecasts,
+    "language": lambda daily: daily.locale.name,
+    "language_value": lambda daily: daily.locale.value,
+    "lowest_temperature": lambda daily: daily.lowest_temperature,
+    "moon_illumination": lambda daily: daily.moon_illumination,
+    "moon_phase_object": lambda daily: daily.moon_phase,
+    "moon_phase_emoji": lambda daily: daily.moon_phase.emoji,
+    "moon_phase_value": lambda daily: daily.moon_phase.value,
+    "moonrise_time": lambda daily: format_time(daily.moonrise),
+    "moonset_time": lambda daily: format_time(daily.moonset),
+    "total_snowfall": lambda daily: daily.snowfall,
+    "sunlight_hours": lambda daily: daily.sunlight,
+    "sunrise_time": lambda daily: format_time(daily.sunrise),
+    "sunset_time": lambda daily: format_time(daily.sunset),
+    "average_daily_temperature": lambda daily: daily.temperature,
+    "measuring_unit_object": lambda daily: daily.unit
+}
+
+HOURLY_FIELDS = {
+    # all are percentages except description obviously
+    "chances_of_fog": lambda hourly: hourly.chances_of_fog,
+    "chances_of_frost": lambda hourly: hourly.chances_of_frost,
+    "chances_of_high_temperature": lambda hourly: hourly.chances_of_high_temperature,
+    "chances_of_overcast": lambda hourly: hourly.chances_of_overcast,
+    "chances_of_rain": lambda hourly: hourly.chances_of_rain,
+    "chances_of_remaining_dry": lambda hourly: hourly.chances_of_remaining_dry,
+    "chances_of_snow": lambda hourly: hourly.chances_of_snow,
+    "chances_of_sunshine": lambda hourly: hourly.chances_of_sunshine,
+    "chances_of_thunder": lambda hourly: hourly.chances_of_thunder,
+    "chances_of_windy": lambda hourly: hourly.chances_of_windy,
+    "cloud_cover": lambda hourly: hourly.cloud_cover,
+    "hourly_forecast_description": lambda hourly: hourly.description,
+    "dew_point": lambda hourly: hourly.dew_point,
+    "feels_like": lambda hourly: hourly.feels_like,
+    "heat_index": lambda hourly: hourly.heat_index.index,
+    "heat_rating": lambda hourly: hourly.heat_index.name,
+    "humidity": lambda hourly: hourly.humidity,
+
+    "weather_kind_object": lambda hourly: hourly.kind,
+    "weather_kind_emoji": lambda hourly: hourly.kind.emoji,
+    "weather_kind": lambda hourly: hourly.kind.name,
+    "weather_kind_value": lambda hourly: hourly.kind.value,  # emoji value???
+
+    "precipitation": lambda hourly: hourly.precipitation,  # Millimeters or Inches
+    "pressure": lambda hourly: hourly.pressure,  # Pascal or Inches
+    "temperature": lambda hourly: hourly.temperature,  # Celsius or Fahrenheit
+    "time": lambda hourly: hourly.time.strftime("%H:%M:%S"),
+    "ultraviolet_object": lambda hourly: hourly.ultraviolet,
+    "ultraviolet_index": lambda hourly: hourly.ultraviolet.index,
+    "ultraviolet_rating": lambda hourly: hourly.ultraviolet.name,
+
+    "unit_object": lambda hourly: hourly.unit,
+    "visibility": lambda hourly: hourly.visibility,
+    "wind_chill": lambda hourly: hourly.wind_chill,
+    "wind_direction": lambda hourly: hourly.wind_direction.name,  # the ontology name for wind_direction_name
+    "wind_direction_object": lambda hourly: hourly.wind_direction,
+    "wind_direction_degrees": lambda hourly: hourly.wind_direction.degrees,
+    "wind_direction_emoji": lambda hourly: hourly.wind_direction.emoji,
+    "wind_direction_name": lambda hourly: hourly.wind_direction.name,
+    "wind_direction_abbr": lambda hourly: hourly.wind_direction.value,
+
+    "wind_gust": lambda hourly: hourly.wind_gust,
+    "wind_speed": lambda hourly: hourly.wind_speed
+}
+
+FIELDS = {'general': GENERAL_FIELDS, 'daily': DAILY_FIELDS, 'hourly': HOURLY_FIELDS}
+
+# hourly fields kept as one float array each in HourlyStore, shaped (day, slot)
+NUMERIC_HOURLY_FIELDS = (
+    'chances_of_fog', 'chances_of_frost', 'chances_of_high_temperature', 'chances_of_overcast', 'chances_of_rain',
+    'chances_of_remaining_dry', 'chances_of_snow', 'chances_of_sunshine', 'chances_of_thunder', 'chances_of_windy',
+    'cloud_cover', 'dew_point', 'feels_like', 'heat_index', 'humidity', 'precipitation', 'pressure', 'temperature',
+    'ultraviolet_index', 'visibility', 'wind_chill', 'wind_direction_degrees', 'wind_gust', 'wind_speed'
+)
+# enum backed fields, stored as small integer codes into a per field category list
+ENUM_HOURLY_FIELDS = ('weather_kind', 'heat_rating', 'ultraviolet_rating', 'wind_direction')
+NUMERIC_DAILY_FIELDS = (
+    'highest_temperature', 'lowest_temperature', 'moon_illumination', 'total_snowfall', 'sunlight_hours',
+    'average_daily_temperature'
+)
+
+AGGREGATE_OPS = ('max', 'min', 'mean', 'first_above', 'first_below')
+COMPARISONS = {
+    '>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '==': operator.eq
+}
+
+
+def numpy():
+    # numpy is most of the cold import of the bot, it is loaded when the first HourlyStore is built
+    return importlib.import_module('numpy')
+
+
+def to_python(value):
+    value = float(value)
+    if math.isnan(value):
+        return None
+    return int(value) if value.is_integer() else round(value, 1)
+
+
+class HourlyStore:
+    """
+    Columnar copy of the hourly forecasts: one float32 array per numeric field and one int8 code array per
+    enum field, all shaped (day, slot). Window arguments are slices, e.g. days=slice(0, 2), slots=slice(4, 6).
+    """
+    def __init__(self, columns, codes, categories, times):
+        self.columns = columns
+        self.codes = codes
+        self.categories = categories
+        self.times = times
+        self.shape = next(iter(columns.values())).shape
+
+    @classmethod
+    def from_forecast(cls, weather):
+        days = [list(daily.hourly_forecasts) for daily in weather.daily_forecasts]
+        hourly = {key: [[HOURLY_FIELDS[key](forecast) for forecast in forecasts] for forecasts in days]
+                  for key in NUMERIC_HOURLY_FIELDS + ENUM_HOURLY_FIELDS + ('time',)}
+        return cls.from_columns(hourly)
+
+    @classmethod
+    def from_columns(cls, hourly):
+        """
+        hourly maps every hourly key to its values per day and slot, as built by flatten_forecast.
+        """
+        np = numpy()
+        days = hourly['time']
+        shape = (len(days), max(len(slots) for slots in days))
+        columns = {key: np.full(shape, np.nan, dtype=np.float32) for key in NUMERIC_HOURLY_FIELDS}
+        codes = {key: np.full(shape, -1, dtype=np.int8) for key in ENUM_HOURLY_FIELDS}
+        categories = {key: [] for key in ENUM_HOURLY_FIELDS}
+        times = max(days, key=len)
+        for day, slots in enumerate(days):
+            for slot in range(len(slots)):
+                for key in NUMERIC_HOURLY_FIELDS:
+                    value = hourly[key][day][slot]
+                    if value is not None:
+                        columns[key][day, slot] = value
+                for key in ENUM_HOURLY_FIELDS:
+                    name = hourly[key][day][slot]
+                    if name not in categories[key]:
+                        categories[key].append(name)
+                    codes[key][day, slot] = categories[key].index(name)
+        return cls(columns, codes, categories, times)
+
+    @property
+    def nbytes(self):
+        return sum(array.nbytes for array in self.columns.values()) + sum(array.nbytes for array in self.codes.values())
+
+    def values(self, key, days=slice(None), slots=slice(None)):
+        return self.columns[key][days, slots]
+
+    def value(self, key, day, slot):
+        if key in self.codes:
+            code = self.codes[key][day, slot]
+            return self.categories[key][code] if code >= 0 else None
+        return to_python(self.columns[key][day, slot])
+
+    def max(self, key, days=slice(None), slots=slice(None)):
+        np = numpy()
+        window = self.values(key, days, slots)
+        return to_python(np.nanmax(window)) if window.size and not np.isnan(window).all() else None
+
+    def min(self, key, days=slice(None), slots=slice(None)):
+        np = numpy()
+        window = self.values(key, days, slots)
+        return to_python(np.nanmin(window)) if window.size and not np.isnan(window).all() else None
+
+    def mean(self, key, days=slice(None), slots=slice(None)):
+        np = numpy()
+        window = self.values(key, days, slots)
+        return to_python(np.nanmean(window)) if window.size and not np.isnan(window).all() else None
+
+    def current_slot(self, local_time):
+        """
+        Index of the slot local_time ('HH:MM:SS') falls in, 0 when the time is unknown.
+        """
+        if not local_time or local_time == 'N/A':
+            return 0
+        return max(sum(1 for time in self.times if time <= local_time) - 1, 0)
+
+    def first_where(self, key, comparison, threshold, days=slice(None), slots=slice(None), from_slot=0):
+        """
+        (day, slot) of the first slot in the window, in time order, where the comparison holds, or None.
+        Enum fields compare by category name with '=='. Slots of today before from_slot are already past
+        and never match.
+        """
+        np = numpy()
+        if key in self.codes:
+            if comparison != '==':
+                raise ValueError(f'{key} is categorical, only == comparisons are supported')
+            if threshold not in self.categories[key]:
+                return None
+            mask = self.codes[key][days, slots] == self.categories[key].index(threshold)
+        else:
+            mask = COMPARISONS[comparison](self.values(key, days, slots), threshold)
+        day_start = days.start or 0
+        slot_start = slots.start or 0
+        if day_start == 0 and from_slot > slot_start and mask.size:
+            mask[0, :from_slot - slot_start] = False
+        if not mask.any():
+            return None
+        day, slot = np.unravel_index(np.argmax(mask), mask.shape)
+        return int(day_start + day), int(slot_start + slot)
+
+
+class ForecastView:
+    """
+    Lazy projection over a forecast: only the (parent, key) datapoints a reply asks for are extracted,
+    for the requested day and time of day slot. materialize() still builds every field for debugging.
+    """
+    def __init__(self, weather):
+        self.weather = weather
+        self.daily_forecasts = list(weather.daily_forecasts)
+        self._hourly_forecasts = {}
+        self._values = {}
+        self._hourly_store = None
+
+    @property
+    def day_count(self):
+        return len(self.daily_forecasts)
+
+    @property
+    def hourly_store(self):
+        if self._hourly_store is None:
+            # a CachedForecast builds its store once and shares it between requests
+            self._hourly_store = getattr(self.weather, 'hourly_store', None) or HourlyStore.from_forecast(self.weather)
+        return self._hourly_store
+
+    def hourly_forecast(self, day_index, tod_index):
+        if day_index not in self._hourly_forecasts:
+            self._hourly_forecasts[day_index] = list(self.daily_forecasts[day_index].hourly_forecasts)
+        return self._hourly_forecasts[day_index][tod_index]
+
+    def resolve(self, parent, key, day_index=0, tod_index=None):
+        cache_key = (parent, key, day_index, tod_index)
+        if cache_key not in self._values:
+            extract = FIELDS[parent][key]
+            if parent == 'general':
+                value = extract(self.weather)
+            elif parent == 'daily':
+                value = extract(self.daily_forecasts[day_index])
+            else:
+                value = extract(self.hourly_forecast(day_index, tod_index))
+            self._values[cache_key] = value
+        return self._values[cache_key]
+
+    def aggregate(self, parent, key, op, days, slots=slice(None), threshold=None):
+        """
+        Reduces a datapoint over a window of days (and hourly slots). first_above/first_below return the
+        (day, slot) of the first match, or None. General datapoints have no range and are resolved as is.
+        """
+        if parent == 'general':
+            return self.resolve(parent, key)
+        if parent == 'daily':
+            if key not in NUMERIC_DAILY_FIELDS or op not in ('max', 'min', 'mean'):
+                return self.resolve(parent, key, days.start or 0)
+            np = numpy()
+            window = np.array([self.resolve(parent, key, day) for day in range(self.day_count)[days]],
+                              dtype=np.float32)
+            return to_python(getattr(np, op)(window)) if window.size else None
+        if op in ('first_above', 'first_below'):
+            # today is searched from the slot the local time falls in, not from midnight
+            from_slot = self.hourly_store.current_slot(self.resolve('general', 'local_datetime'))
+            comparison = '>' if op == 'first_above' else '<'
+            return self.hourly_store.first_where(key, comparison, threshold, days, slots, from_slot)
+        return getattr(self.hourly_store, op)(key, days, slots)
+
+    def materialize(self):
+        return {
+            'general': {key: extract(self.weather) for key, extract in GENERAL_FIELDS.items()},
+            'daily': [{key: extract(daily) for key, extract in DAILY_FIELDS.items()}
+                      for daily in self.daily_forecasts],
+            'hourly': [[{key: extract(hourly) for key, extract in HOURLY_FIELDS.items()}
+                        for hourly in daily.hourly_forecasts] for daily in self.daily_forecasts]
+        }
+
+
+def jsonable(value):
+    # anything that is not a plain json value is stored as the text it would be rendered as in a reply
+    if value is None or type(value) in (bool, int, float, str):
+        return value
+    return format(value)
+
+
+def flatten_forecast(weather):
+    """
+    Every renderable datapoint of a forecast as plain json values, daily and hourly fields stored column wise:
+    {'general': {key: value}, 'daily': {key: [value per day]}, 'hourly': {key: [[value per slot] per day]}}
+    """
+    days = list(weather.daily_forecasts)
+    hourly = [list(daily.hourly_forecasts) for daily in days]
+    return {
+        'general': {key: jsonable(extract(weather)) for key, extract in GENERAL_FIELDS.items()},
+        'daily': {key: [jsonable(extract(daily)) for daily in days]
+                  for key, extract in DAILY_FIELDS.items() if not key.endswith('_generator')},
+        'hourly': {key: [[jsonable(extract(forecast)) for forecast in forecasts] for forecasts in hourly]
+                   for key, extract in HOURLY_FIELDS.items()}
+    }
+
+
+class FlatForecast:
+    """
+    A forecast restored from its flattened values (see flatten_forecast), no python_weather objects involved.
+    """
+    def __init__(self, flat, fetched_at=None):
+        self.flat = flat
+        self.fetched_at = fetched_at
+        self._hourly_store = None
+
+    @property
+    def hourly_store(self):
+        if self._hourly_store is None:
+            self._hourly_store = HourlyStore.from_columns(self.flat['hourly'])
+        return self._hourly_store
+
+
+class FlatForecastView(ForecastView):
+    """
+    ForecastView over a FlatForecast, resolve and aggregate read the stored values directly.
+    """
+    def __init__(self, weather):
+        self.weather = weather
+        self.flat = weather.flat
+        self._values = {}
+        self._hourly_store = None
+
+    @property
+    def day_count(self):
+        return len(self.flat['hourly']['time'])
+
+    def resolve(self, parent, key, day_index=0, tod_index=None):
+        if parent == 'general':
+            return self.flat['general'][key]
+        if parent == 'daily':
+            return self.flat['daily'][key][day_index]
+        return self.flat['hourly'][key][day_index][tod_index]
+
+    def materialize(self):
+        daily, hourly = self.flat['daily'], self.flat['hourly']
+        return {
+            'general': dict(self.flat['general']),
+            'daily': [{key: values[day] for key, values in daily.items()} for day in range(self.day_count)],
+            'hourly': [[{key: values[day][slot] for key, values in hourly.items()}
+                        for slot in range(len(hourly['time'][day]))] for day in range(self.day_count)]
+        }
+
+
+def view_for(weather):
+    return FlatForecastView(weather) if isinstance(weather, FlatForecast) else ForecastView(weather)
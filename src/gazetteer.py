@@ -0,0 +1,168 @@
+import os
+import re
+import unicodedata
+from collections import namedtuple
+
+
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'gazetteer.tsv')
+GAZETTEER_MAX_TOKENS = 8
+GAZETTEER_MAX_CHARS = 64
+GAZETTEER_RESOLVE_CACHE_SIZE = 4096
+
+# names that come out of a question but are not places the weather can be fetched for
+NOT_PLACES = {'here', 'there', 'outside', 'home', 'my location', 'current location', 'my area', 'my city',
+              'somewhere', 'anywhere', 'everywhere', 'nowhere', 'the city', 'city', 'town', 'the world', 'world',
+              'earth', 'location', 'weather', 'today', 'tomorrow', 'unknown', 'none', 'null', 'n a'}
+
+
+class UnknownLocationError(LookupError):
+    pass
+
+
+Place = namedtuple('Place', ['key', 'name', 'latitude', 'longitude'])
+
+
+def normalize_place(text):
+    # accents, punctuation and case do not tell places apart: 'Zürich, CH' -> 'zurich ch'
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    return ' '.join(re.sub(r"[^a-z0-9]+", ' ', text.lower().replace("'", '').replace('.', '')).split())
+
+
+class Gazetteer:
+    """
+    Offline index from free text locations to canonical places, so 'nyc', 'New York' and 'new york city, ny'
+    share one cache key and one upstream fetch. Aliases are kept in a character trie: resolve() takes the longest
+    alias at the start of the text whose remaining words name the place's country or region. Unknown places
+    resolve to None and are fetched as written, only text that can not be a place at all is rejected by
+    plausible(). Bolton is not a typo of Boston, the closest alias within a small edit distance is only offered
+    by suggest() as a 'did you mean'.
+    """
+    def __init__(self, path=GAZETTEER_PATH):
+        self.path = path
+        self.places = {}
+        self._trie = {}
+        self._qualifiers = {}
+        self._rank = {}
+        self._resolved = {}
+        if path and os.path.exists(path):
+            self.load(path)
+        else:
+            print(f'Gazetteer {path} not found, locations are only normalized')
+
+    def load(self, path):
+        names = {}
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                if not line.strip() or line.startswith('#'):
+                    continue
+                kind, key, name, latitude, longitude, aliases = line.rstrip('\n').split('\t')
+                aliases = {normalize_place(name)} | {normalize_place(alias) for alias in aliases.split('|') if alias}
+                if kind == 'city':
+                    place = Place(key, name, float(latitude), float(longitude))
+                    self.places[key] = place
+                    self._rank[key] = len(self._rank)
+                    # a city is qualified by its country and region, e.g. 'us' and 'us/ny' for 'us/ny/new-york'
+                    parts = key.split('/')
+                    self._qualifiers[key] = {'/'.join(parts[:end]) for end in range(1, len(parts))}
+                    for alias in aliases:
+                        self._insert(alias, place)
+                else:
+                    names[key] = aliases | {key.split('/')[-1]}
+        self._qualifiers = {key: {name for area in areas for name in names.get(area, ())}
+                            for key, areas in self._qualifiers.items()}
+        print(f'Gazetteer: {len(self.places)} places from {path}')
+
+    def _insert(self, alias, place):
+        node = self._trie
+        for char in alias:
+            node = node.setdefault(char, {})
+        node.setdefault('', []).append(place)
+
+    def exact(self, text):
+        node = self._trie
+        for char in text:
+            node = node.get(char)
+            if node is None:
+                return []
+        return node.get('', [])
+
+    def fuzzy(self, text):
+        """
+        Places whose alias is the fewest edits (Levenshtein) away from text, within 1 edit for short names and 2
+        for long ones. Walks the trie with one row of the edit distance table per node, skipping any branch
+        whose row is already over the limit. Typos rarely hit the first letter, so only aliases sharing it are
+        searched.
+        """
+        max_edits = 0 if len(text) < 6 else 1 if len(text) < 10 else 2
+        if not max_edits:
+            return []
+        best = [max_edits, []]
+
+        def walk(node, row):
+            for char, child in node.items():
+                if not char:
+                    continue
+                next_row = [row[0] + 1]
+                for column in range(1, len(text) + 1):
+                    next_row.append(min(next_row[column - 1] + 1, row[column] + 1,
+                                        row[column - 1] + (text[column - 1] != char)))
+                if '' in child and next_row[-1] <= best[0]:
+                    if next_row[-1] < best[0] or not best[1]:
+                        best[:] = [next_row[-1], []]
+                    best[1].extend(child[''])
+                if min(next_row) <= best[0]:
+                    walk(child, next_row)
+
+        first = self._trie.get(text[0])
+        if first is not None:
+            # the row for the shared first letter
+            walk(first, [1] + list(range(len(text))))
+        return sorted(set(best[1]), key=lambda place: self._rank[place.key])
+
+    def qualified(self, place, words):
+        # every remaining word belongs to a name of the place's country or region ('new york city ny usa')
+        if not words:
+            return True
+        qualifiers = self._qualifiers.get(place.key, ())
+        return any(' '.join(words[:end]) in qualifiers and self.qualified(place, words[end:])
+                   for end in range(1, len(words) + 1))
+
+    def first_place(self, text, match):
+        words = text.split()
+        if not 0 < len(words) <= GAZETTEER_MAX_TOKENS or not self._trie:
+            return None
+        for end in range(len(words), 0, -1):
+            candidates = [candidate for candidate in match(' '.join(words[:end]))
+                          if self.qualified(candidate, words[end:])]
+            if candidates:
+                return candidates[0]
+        return None
+
+    def resolve(self, location):
+        """
+        The place an exact name or alias names, None otherwise.
+        """
+        text = normalize_place(location)
+        if text in self._resolved:
+            return self._resolved[text]
+        place = self.first_place(text, self.exact)
+        if len(self._resolved) >= GAZETTEER_RESOLVE_CACHE_SIZE:
+            self._resolved.clear()
+        self._resolved[text] = place
+        return place
+
+    def suggest(self, location):
+        """
+        The known place a location that does not resolve is closest to, for a 'did you mean', or None.
+        """
+        if self.resolve(location) is not None:
+            return None
+        return self.first_place(normalize_place(location), self.fuzzy)
+
+    def plausible(self, location):
+        text = normalize_place(location)
+        return bool(text) and text not in NOT_PLACES and len(location) <= GAZETTEER_MAX_CHARS \
+            and len(text.split()) <= GAZETTEER_MAX_TOKENS and any(char.isalnum() for char in text)
+
+    def stats(self):
+        return {"path": self.path, "places": len(self.places), "resolved": len(self._resolved)}
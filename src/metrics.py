@@ -0,0 +1,195 @@
+import json
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+# upper bounds of the stage latency histogram buckets, in seconds
+STAGE_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20)
+
+
+class Trace:
+    """
+    Spans and counts of one answer, also added to the process wide Metrics.
+    """
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.start = time.perf_counter()
+        self.spans = []
+        self.counts = {}
+
+    @contextmanager
+    def span(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            self.spans.append((stage, start - self.start, seconds))
+            self.metrics.observe(stage, seconds)
+
+    def add(self, stage, seconds, offset=0.0):
+        # a stage the caller timed itself
+        self.spans.append((stage, offset, seconds))
+        self.metrics.observe(stage, seconds)
+
+    def count(self, name, value=1, **labels):
+        key = (name,) + tuple(sorted(labels.items()))
+        self.counts[key] = self.counts.get(key, 0) + value
+        self.metrics.inc(name, value, **labels)
+
+    def summary(self):
+        return {
+            "spans": [{"stage": stage, "start_ms": 1000 * offset, "duration_ms": 1000 * seconds}
+                      for stage, offset, seconds in self.spans],
+            "counts": [dict(labels, name=key[0], value=value)
+                       for key, value in self.counts.items() for labels in [dict(key[1:])]]
+        }
+
+
+class NullTrace:
+    """
+    Stand-in while metrics are disabled, every call is a no-op so the instrumented code pays next to nothing.
+    """
+    _span = nullcontext()
+    spans = ()
+    counts = {}
+
+    def span(self, stage):
+        return self._span
+
+    def add(self, stage, seconds, offset=0.0):
+        pass
+
+    def count(self, name, value=1, **labels):
+        pass
+
+    def summary(self):
+        return None
+
+
+NULL_TRACE = NullTrace()
+
+
+class Metrics:
+    """
+    Process wide stage latency histograms and counters, plus collectors: named callables returning the stats dicts
+    the caches, upstreams and stores already keep, read only when a snapshot is taken. Exported as a JSON snapshot
+    or in the Prometheus text format. Disabled metrics hand out NULL_TRACE and record nothing.
+    """
+    def __init__(self, enabled=False, prefix='weather_bot', buckets=STAGE_BUCKETS):
+        self.enabled = enabled
+        self.prefix = prefix
+        self.buckets = buckets
+        self._stages = {}
+        self._counters = {}
+        self._collectors = {}
+        self._lock = threading.Lock()
+
+    def trace(self):
+        return Trace(self) if self.enabled else NULL_TRACE
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = {"buckets": [0] * len(self.buckets), "count": 0, "sum": 0.0}
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    histogram["buckets"][index] += 1
+                    break
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+
+    def inc(self, name, value=1, **labels):
+        key = (name,) + tuple(sorted(labels.items()))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register(self, name, collect):
+        if self.enabled:
+            self._collectors[name] = collect
+
+    def snapshot(self):
+        with self._lock:
+            stages = {stage: {"count": histogram["count"], "sum_ms": 1000 * histogram["sum"],
+                              "mean_ms": 1000 * histogram["sum"] / histogram["count"],
+                              "buckets": dict(zip(self.buckets, histogram["buckets"]))}
+                      for stage, histogram in self._stages.items()}
+            counters = [dict(labels, name=key[0], value=value)
+                        for key, value in self._counters.items() for labels in [dict(key[1:])]]
+            collectors = dict(self._collectors)
+        collected = {}
+        for name, collect in collectors.items():
+            try:
+                collected[name] = collect()
+            except Exception as e:
+                collected[name] = {"error": f'{type(e).__name__}: {e}'}
+        return {"enabled": self.enabled, "stages": stages, "counters": counters, "collectors": collected}
+
+    def prometheus(self):
+        snapshot = self.snapshot()
+        lines = [f'# TYPE {self.prefix}_stage_seconds histogram']
+        for stage, histogram in snapshot["stages"].items():
+            cumulative = 0
+            for bound, count in histogram["buckets"].items():
+                cumulative += count
+                lines.append(f'{self.prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+            lines.append(f'{self.prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram["count"]}')
+            lines.append(f'{self.prefix}_stage_seconds_sum{{stage="{stage}"}} {histogram["sum_ms"] / 1000}')
+            lines.append(f'{self.prefix}_stage_seconds_count{{stage="{stage}"}} {histogram["count"]}')
+        for counter in sorted({counter["name"] for counter in snapshot["counters"]}):
+            lines.append(f'# TYPE {self.prefix}_{counter}_total counter')
+            for labels in snapshot["counters"]:
+                if labels["name"] == counter:
+                    lines.append(f'{self.prefix}_{counter}_total{format_labels(labels)} {labels["value"]}')
+        for name, stats in snapshot["collectors"].items():
+            lines.append(f'# TYPE {self.prefix}_{name} gauge')
+            for stat, value in flatten_stats(stats):
+                lines.append(f'{self.prefix}_{name}{{stat="{stat}"}} {float(value)}')
+        return '\n'.join(lines) + '\n'
+
+    def serve(self, port, host='0.0.0.0'):
+        """
+        Serves /metrics (Prometheus text) and /metrics.json from a daemon thread.
+        """
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.rstrip('/') == '/metrics':
+                    body, content_type = metrics.prometheus().encode(), 'text/plain; version=0.0.4'
+                elif self.path.rstrip('/') == '/metrics.json':
+                    body, content_type = json.dumps(metrics.snapshot(), default=str).encode(), 'application/json'
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, name='weather-bot-metrics', daemon=True).start()
+        print(f'Serving metrics on http://{host}:{port}/metrics')
+        return server
+
+
+def format_labels(labels):
+    labels = {key: value for key, value in labels.items() if key not in ('name', 'value')}
+    return '{' + ','.join(f'{key}="{value}"' for key, value in sorted(labels.items())) + '}' if labels else ''
+
+
+def flatten_stats(stats, prefix=''):
+    # nested stats dicts to (dotted name, number) pairs, anything that is not a number is skipped
+    for key, value in stats.items():
+        name = f'{prefix}{key}'
+        if isinstance(value, dict):
+            yield from flatten_stats(value, f'{name}.')
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield name, value
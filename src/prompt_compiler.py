@@ -0,0 +1,159 @@
+import json
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+
+EXTRACT_QUERY_RULES = """\
+"Overall Rules:
+" - Identify the single most relevant ontology parent key and weather datapoint key as a pair that satisfies each weather data request in the user input query."
+" - Assume all weather and atmospheric data requests are 'general' unless a specific time of day or recurring daily weather phenomenon is given."
+" - If the input query is nondescript default to the 'general' parent key and pull the 'current_forecast_description'"
+" - Do not give Hourly or Daily data points unless explicitly required, default to the 'general' data points. 
+" - EX. [['general', 'local_datetime'], ['general', 'sunrise_time'], ['general', 'wind_speed'], ['daily', 'sunlight_hours']]"
+"User Intent Rules:"
+" - Choose the appropriate intent label from the list: ['get_weather', 'greeting', 'goodbye', 'unknown']"
+" - If the user intent is to 'get_weather' continue to the next rules. If not skip to the response: and format: rules to satisfy thier other intents."
+"Temporal Rules:
+"Date: REQUIRED"
+" - Extract the the intended date of the query. The data is constrained to two days in the future from todays date! If a day of the week is used use the 'day of the week mapping' to calculate if the delta of the query is within or equal to the range of 3."
+" - If the request date delta is out of range leave the date as an empty string and skip to the response: and format: rules to request they adjust thier query to be within the data availability range."
+" - If not, select the appropriate relative date term ['today', 'tomorrow', 'two days']. If no date term is given at all assume the date query is for 'today'."
+"Time:"
+" - If a time of day is specified select the appropriate label from the time_of_day_mapping. If not, the value should remain an empty string."
+" - If any of the chosen ontology parent keys are 'hourly' but no time of day is mentioned in then just assume that the weather datapoint keys should be pulled for 'noon', '12:00:00'."
+"Aggregate Rules:"
+" - If the user asks for an extreme, an average or a crossing over a period ('highest chance of rain this afternoon', 'lowest temperature over the next two days', 'when will the chance of snow go above 50%') set "aggregate" to {"op": ..., "through": ..., "threshold": ...}. Otherwise "aggregate" is null."
+" - op 'max', 'min' or 'mean' reduces the datapoint over the window. op 'first_above' or 'first_below' finds the first slot where the datapoint crosses the numeric "threshold", its injected value reads like 'tomorrow at 15:00' so do not add a unit after it."
+" - The window starts at "date" and ends at the relative date term "through" (empty for a single day). A time of day narrows every day to its window, with no time the whole day is used and the 'noon' default does not apply."
+" - Only numeric hourly datapoints can be aggregated, numeric daily datapoints can be reduced with max/min/mean over several days."
+"Spatial Rule"
+"Location: REQUIRED"
+" - Extract the intended location (this could be a city, county, region or coordinates). If no location is given, the value should remain an empty string and skip to the response: and format: rules to request they provide a location."
+" - If several locations are asked about ('compare Berlin and London'), list each one in "locations" in the order given (at most 5) and set "location" to the first. For a single location "locations" holds just that one."
+"Response (Generation) Rules:"
+" - If all of the above points are successfully extracted set the "complete" value to lower case true boolean. Else remain false."
+" - Considering the context that you extracted above (Location, relative date, time of day, intent) formulate a chatbot response that is friendly and contains this data explicitely. 
+" - !IMPORTANT RESPONSE FORMATTING! Use curly brackets {insert_variable} surrounding the selected ontological weather datapoint key(s) as an injectable variable(s) to satify the user data request which will be retrieved later. !!DO NOT EVER!! Add these unwanted characters '"' to the curly bracket injection!!"
+" - The weather datapoints will be injected into the f-string {insert_variable} and is followed by the appropriate datatype symbol (%, KPH, MPH, C°, F°, K, Ect.) from the ontology. Choose the metric unit unless otherwise specified "
+" - EX: 'The percent chance of rain this afternoon in Berlin, Germany is "{chances_of_rain}"%.'"
+" - For several locations write the response for one location and use {location} in place of its name, it is filled in and repeated for every location. EX: 'Tomorrow in {location} it will be {temperature}°C.'"
+" - If any required data point is missing, formulate our chatbot_response to request the user to provide the missing information. The 'complete' value should remain False."
+" - If the conversation state shows that they have expressed a sentiment (positive or netural) about your previous response in the conversation state you may add a sentence referencing their sentiment."
+" - If the intent is unknown and the request is unable to be satisfied, formulate th chatbot_response to apologize and ask for different request that is within the aformentioned rules. The 'complete' value should remain False."
+" - If the user wants to terminate the chat (intent: 'goodbye') say your goodbyes, set (complete: true) and the other values should remain as they are."
+"Output Format Rules"
+"Only output a singular a structured JSON formatted array based on the example below :
+"{
+  "ontology_labels": ["list_of_relevant_ontology_datapoint_pairs"],
+  "intent": "intent_label",
+  "date": "relative_date_terms",
+  "time": "time_of_day_mapping",
+  "location": "location_choice",
+  "locations": ["every_location_choice"],
+  "complete": Bool,
+  "aggregate": null or {"op": "aggregate_op", "through": "relative_date_terms", "threshold": number or null},
+  "response": "chatbot_response"
+}"
+"Finally check your output and remove any extra text that may be outside of the json array, check for trailing commas, missing or extra brackets, incorrect brackets (ontology_labels uses square brackets [], response uses curly brackets for injection {}), do not add backslashes '"' to the curly bracket injection."
+"""
+
+# ontology types that only describe python objects, these can never be injected into a reply
+NON_RENDERABLE_TYPES = ('auto', 'Iterable[HourlyForecast]', 'Iterable[DailyForecast]')
+
+ONTOLOGY_UNIT_ABBREVIATIONS = {
+    'int (percent)': '%',
+    'int (Celsius/Fahrenheit)': 'C/F',
+    'Celsius/Fahrenheit': 'C/F',
+    'float (Millimeters/Inches)': 'mm/in',
+    'float (Pascal/Inches)': 'Pa/in',
+    'float (Centimeters/Inches)': 'cm/in',
+    'int (Kilometers/Miles)': 'km/mi',
+    'int (Kilometers_per_hour/Miles_per_hour)': 'kph/mph',
+    'int (KPH/MPH)': 'kph/mph',
+    'float (hours)': 'h',
+    'int (degrees)': 'deg',
+    'time | None': 'time'
+}
+
+
+def count_tokens(text, model='gpt-4o'):
+    """
+    Token count with tiktoken when it is installed, otherwise the usual ~4 characters per token estimate.
+    """
+    if tiktoken is None:
+        return (len(text) + 3) // 4
+    try:
+        encoding = tiktoken.encoding_for_model(model)
+    except KeyError:
+        encoding = tiktoken.get_encoding('o200k_base')
+    return len(encoding.encode(text))
+
+
+class PromptCompiler:
+    """
+    Builds the extract_query prompt as a static prefix and a small per request suffix.
+    The prefix (rules, compact ontology and mappings) is compiled once and is byte identical for every call,
+    so it can be served from the provider side prompt cache. Only the user input, the date and the
+    conversation state fields that differ from the empty state are sent per request.
+    """
+    def __init__(self, ontology, time_of_day_mapping, day_of_the_week_mapping, data_date_constraint,
+                 empty_state, model='gpt-4o'):
+        self.ontology = ontology
+        self.time_of_day_mapping = time_of_day_mapping
+        self.day_of_the_week_mapping = day_of_the_week_mapping
+        self.data_date_constraint = data_date_constraint
+        self.empty_state = empty_state
+        self.model = model
+        self.static_prefix = self.compile_static_prefix()
+        self.static_prefix_tokens = count_tokens(self.static_prefix, model)
+
+    def compile_ontology(self):
+        lines = []
+        for parent, datapoints in self.ontology.items():
+            groups = {}
+            for key, key_type in datapoints.items():
+                if key_type in NON_RENDERABLE_TYPES or key.endswith(('_object', '_generator')):
+                    continue
+                groups.setdefault(ONTOLOGY_UNIT_ABBREVIATIONS.get(key_type, key_type), []).append(key)
+            for unit, keys in groups.items():
+                lines.append(f'{parent} [{unit}]: {", ".join(keys)}')
+        return '\n'.join(lines)
+
+    def compile_static_prefix(self):
+        times = ', '.join(f"{label}={mapping['time'][:5]}" for label, mapping in self.time_of_day_mapping.items())
+        slot_times = {mapping['index']: mapping['time'][:5] for mapping in self.time_of_day_mapping.values()}
+        windows = ', '.join(f"{label}={slot_times[mapping['window'][0]]}-{slot_times.get(mapping['window'][1], '24:00')}"
+                            for label, mapping in self.time_of_day_mapping.items() if 'window' in mapping)
+        weekdays = ', '.join(f'{day}={index}' for day, index in self.day_of_the_week_mapping.items())
+        date_terms = ', '.join(self.data_date_constraint)
+        return (
+            'You are operating as a weather chat bot. Select the weather datapoint keys from the ontology that would '
+            'satisfy the user input query. Then construct a json object with the same keys as the conversation state: '
+            '("ontology_labels", "intent", "date": "relative_date_terms", "time", "location", "locations", "complete", '
+            '"aggregate", "response").\n'
+            f'{EXTRACT_QUERY_RULES}\n'
+            f'Day of the week mapping: {weekdays}\n'
+            f'Relative date terms: {date_terms}\n'
+            f'Available hourly data times (time_of_day_mapping): {times}\n'
+            f'Aggregate windows per time of day: {windows}\n'
+            'Weather data ontology, one line per parent key and unit ([C/F] is Celsius/Fahrenheit):\n'
+            f'{self.compile_ontology()}'
+        )
+
+    def state_delta(self, state):
+        return {key: value for key, value in state.items() if value != self.empty_state.get(key)}
+
+    def compile_request(self, user_input, todays_date, day_of_week, state):
+        delta = self.state_delta(state)
+        lines = [f'Today: {day_of_week} {todays_date.strftime("%Y-%m-%d")}']
+        if delta:
+            lines.append(f'Conversation state (unset fields omitted): {json.dumps(delta, ensure_ascii=False, separators=(",", ":"))}')
+        lines.append(f'User input: {json.dumps(user_input, ensure_ascii=False)}')
+        return '\n'.join(lines)
+
+    def token_stats(self):
+        # the per request tokens are counted from the completion usage, only the shared prefix is reported here
+        return {"static_prefix_tokens": self.static_prefix_tokens, "estimated": tiktoken is None}
@@ -0,0 +1,392 @@
+import re
+
+from forecast_view import NUMERIC_HOURLY_FIELDS
+
+
+# phrase -> datapoint key per ontology parent, longest phrases are matched first
+WEATHER_KEYWORDS = [
+    (('local time', 'time is it'), {'general': 'local_datetime'}),
+    (('average temperature', 'avg temperature', 'mean temperature'), {'daily': 'average_daily_temperature'}),
+    (('highest temperature', 'high temperature', 'maximum temperature', 'max temperature'),
+     {'daily': 'highest_temperature'}),
+    (('lowest temperature', 'low temperature', 'minimum temperature', 'min temperature'),
+     {'daily': 'lowest_temperature'}),
+    (('feels like', 'feel like'), {'general': 'feels_like', 'hourly': 'feels_like'}),
+    (('temperature', 'temp', 'how hot', 'how cold', 'how warm'), {'general': 'temperature', 'hourly': 'temperature'}),
+    (('humidity', 'humid'), {'general': 'humidity', 'hourly': 'humidity'}),
+    (('wind direction',), {'general': 'wind_cardinal_direction'}),
+    (('wind gust', 'gusts', 'gust'), {'hourly': 'wind_gust'}),
+    (('wind chill',), {'hourly': 'wind_chill'}),
+    (('wind speed', 'windspeed', 'how windy', 'windy', 'wind'), {'general': 'wind_speed', 'hourly': 'wind_speed'}),
+    (('uv index', 'ultraviolet', 'uv'), {'general': 'uv_index', 'hourly': 'ultraviolet_index'}),
+    (('heat index', 'heat'), {'hourly': 'heat_index'}),
+    (('dew point',), {'hourly': 'dew_point'}),
+    (('pressure',), {'general': 'pressure', 'hourly': 'pressure'}),
+    (('visibility',), {'general': 'visibility', 'hourly': 'visibility'}),
+    (('precipitation',), {'general': 'precipitation', 'hourly': 'precipitation'}),
+    (('cloud cover', 'cloudy', 'clouds'), {'hourly': 'cloud_cover'}),
+    (('snowfall',), {'daily': 'total_snowfall'}),
+    (('rain', 'raining', 'rainy'), {'hourly': 'chances_of_rain'}),
+    (('snow', 'snowing'), {'hourly': 'chances_of_snow'}),
+    (('thunderstorm', 'thunder', 'storm'), {'hourly': 'chances_of_thunder'}),
+    (('fog', 'foggy'), {'hourly': 'chances_of_fog'}),
+    (('frost',), {'hourly': 'chances_of_frost'}),
+    (('sunshine', 'sunny'), {'hourly': 'chances_of_sunshine'}),
+    (('overcast',), {'hourly': 'chances_of_overcast'}),
+    (('sunrise', 'sun rise', 'sun come up'), {'daily': 'sunrise_time'}),
+    (('sunset', 'sun set', 'sun go down'), {'daily': 'sunset_time'}),
+    (('moonrise', 'moon rise'), {'daily': 'moonrise_time'}),
+    (('moonset', 'moon set'), {'daily': 'moonset_time'}),
+    (('moon illumination',), {'daily': 'moon_illumination'}),
+    (('full moon', 'moon phase', 'moon'), {'daily': 'moon_phase_value'}),
+    (('sunlight', 'daylight'), {'daily': 'sunlight_hours'}),
+    (('weather', 'forecast', 'conditions'),
+     {'general': 'current_forecast_description', 'hourly': 'hourly_forecast_description'}),
+]
+
+LOCATION_SEPARATORS = {'and', '&', 'or', 'vs', 'versus'}
+# 'in Berlin and what about tomorrow', a separator followed by these starts a new clause, not a location
+CLAUSE_WORDS = {'what', 'how', 'is', 'will', 'when', 'where', 'does', 'do', 'can', 'also', 'then', 'it', 'i'}
+# comparing the same datapoint across locations is answered per location, no LLM needed
+COMPARE_WORDS = {'compare', 'vs', 'versus'}
+
+# questions that need reasoning over the data rather than a lookup are left to the LLM
+LOW_CONFIDENCE_WORDS = {'compare', 'vs', 'versus', 'than', 'why', 'should', 'wear', 'umbrella', 'week', 'weekend',
+                        'yesterday', 'ago', 'last'}
+
+GREETING_WORDS = {'hi', 'hello', 'hey', 'hiya', 'howdy', 'yo', 'greetings', 'good', 'morning', 'afternoon',
+                  'evening', 'there', 'bot', 'weatherbot'}
+# 'Good morning! What's the temperature in Berlin?' greets, it does not ask about the morning
+LEADING_GREETING_PATTERN = re.compile(r"^(?:(?:hi|hello|hey|hiya|howdy|yo|greetings|good (?:morning|afternoon|evening)"
+                                      r"|there|bot|weatherbot)\b[\s,!.]*)+")
+GOODBYE_PHRASES = ('good bye', 'goodbye', 'bye', 'see you', 'see ya', 'farewell', 'all done', "that's all",
+                   'that is all')
+
+TIME_ALIASES = {'tonight': 'night', 'midday': 'noon', 'lunchtime': 'noon', 'dawn': 'early morning'}
+TIME_PHRASES = {
+    'midnight': 'at midnight',
+    'early morning': 'in the early morning',
+    'morning': 'in the morning',
+    'late morning': 'in the late morning',
+    'noon': 'at noon',
+    'afternoon': 'in the afternoon',
+    'evening': 'in the evening',
+    'night': 'at night'
+}
+DATE_PHRASES = {'today': 'today', 'tomorrow': 'tomorrow', 'two days': 'in two days'}
+TWO_DAY_PHRASES = ('day after tomorrow', 'in two days', 'in 2 days', 'two days from now')
+
+# ranges starting today, keyed by the last relative date term they cover
+SPAN_PHRASES = {
+    'tomorrow': (('next two days', 'next 2 days', 'today and tomorrow'), 'over the next two days'),
+    'two days': (('next three days', 'next 3 days', 'next few days', 'coming days'), 'over the next three days')
+}
+AGGREGATE_WORDS = {'highest': 'max', 'max': 'max', 'maximum': 'max', 'peak': 'max', 'lowest': 'min', 'min': 'min',
+                   'minimum': 'min', 'average': 'mean', 'avg': 'mean', 'mean': 'mean'}
+AGGREGATE_PHRASES = {'max': 'highest', 'min': 'lowest', 'mean': 'average'}
+# daily keys that already name their reduction, 'lowest temperature over the next two days'
+DAILY_KEY_AGGREGATES = {'highest_': 'max', 'lowest_': 'min', 'average_': 'mean'}
+# clock times the 3 hourly slots can not answer as asked, '5pm', '17:30', 'at 9 o'clock'
+CLOCK_TIME_PATTERN = re.compile(r"\b\d{1,2}(?::\d{2})?\s*(?:am|pm|a\.m|p\.m)\b|\b\d{1,2}:\d{2}\b|\bo'?clock\b")
+THRESHOLD_PATTERN = re.compile(r'\b(above|over|more than|greater than|exceeds?|below|under|less than)\s+(\d+)\b')
+
+UNIT_SUFFIXES = {
+    'int (percent)': '%',
+    'int (Celsius/Fahrenheit)': '°C',
+    'Celsius/Fahrenheit': '°C',
+    'float (Millimeters/Inches)': ' mm',
+    'float (Pascal/Inches)': ' hPa',
+    'float (Centimeters/Inches)': ' cm',
+    'int (Kilometers/Miles)': ' km',
+    'int (Kilometers_per_hour/Miles_per_hour)': ' km/h',
+    'int (KPH/MPH)': ' km/h',
+    'float (hours)': ' hours',
+    'int (degrees)': '°'
+}
+DATAPOINT_PHRASES = {
+    'local_datetime': 'local time',
+    'current_forecast_description': 'weather',
+    'hourly_forecast_description': 'weather',
+    'average_daily_temperature': 'average temperature',
+    'wind_cardinal_direction': 'wind direction',
+    'ultraviolet_index': 'UV index',
+    'uv_index': 'UV index',
+    'total_snowfall': 'total snowfall',
+    'moon_phase_value': 'moon phase',
+    'sunlight_hours': 'amount of sunlight',
+}
+
+
+class LocalQueryParser:
+    """
+    Deterministic intent and slot extractor for the common, simple queries.
+    parse returns the same parsed_query_data shape as extract_query, or None when the input is not
+    understood confidently enough and should go to the LLM instead.
+    """
+    def __init__(self, ontology, time_of_day_mapping, day_of_the_week_mapping, data_date_constraint,
+                 confidence_threshold=0.8, is_place=None):
+        self.ontology = ontology
+        self.time_of_day_mapping = time_of_day_mapping
+        self.day_of_the_week_mapping = day_of_the_week_mapping
+        self.data_date_constraint = data_date_constraint
+        self.confidence_threshold = confidence_threshold
+        # tells a known place from any other span, every span counts as a place when None
+        self.is_place = is_place
+
+        self.keyword_patterns = sorted(
+            ((re.compile(r'\b' + re.escape(phrase) + r'\b'), parents)
+             for phrases, parents in WEATHER_KEYWORDS for phrase in phrases),
+            key=lambda item: -len(item[0].pattern))
+        self.time_patterns = sorted(
+            ((re.compile(r'\b' + re.escape(phrase) + r'\b'), TIME_ALIASES.get(phrase, phrase))
+             for phrase in list(time_of_day_mapping) + list(TIME_ALIASES)),
+            key=lambda item: -len(item[0].pattern))
+        self.date_pattern = re.compile(r'\b(?:' + '|'.join(['today', 'tonight', 'now', 'tomorrow']
+                                                           + list(day_of_the_week_mapping)) + r')\b')
+        self.goodbye_pattern = re.compile(r'\b(?:' + '|'.join(re.escape(p) for p in GOODBYE_PHRASES) + r')\b')
+        # 'London temperature', a datapoint ends the place name it follows
+        self.datapoint_start = re.compile(r'(?:' + '|'.join(sorted(
+            (re.escape(phrase) for phrases, _ in WEATHER_KEYWORDS for phrase in phrases), key=len, reverse=True))
+            + r')\b')
+
+        self.location_stop_words = {'today', 'tomorrow', 'tonight', 'this', 'next', 'at', 'on', 'around', 'and',
+                                    'the', 'in', 'for', 'now', 'right', 'later', 'please', 'day', 'days', 'over',
+                                    'during', 'through', 'until', 'when', 'above', 'below', 'under', 'between'}
+        self.location_stop_words.update(word for label in time_of_day_mapping for word in label.split())
+        self.location_stop_words.update(word for term in data_date_constraint for word in term.split())
+        self.location_stop_words.update(day_of_the_week_mapping)
+
+    def extract_location(self, user_input):
+        locations = self.extract_locations(user_input)
+        return locations[0] if locations else None
+
+    def extract_locations(self, user_input):
+        """
+        'in Berlin and London' -> ['Berlin', 'London'], up to 4 words per location. A location ends at a date term
+        or datapoint, 'compare' only counts when a known place follows it.
+        """
+        words = user_input.split()
+        bare_words = [word.lower().strip(",.?!") for word in words]
+        for i, word in enumerate(bare_words):
+            if word not in ('in', 'at', 'for', 'compare', 'between'):
+                continue
+            locations = [[]]
+            for j, word in enumerate(words[i + 1:], i + 1):
+                bare = bare_words[j]
+                if bare in LOCATION_SEPARATORS and locations[-1] and j + 1 < len(words) \
+                        and bare_words[j + 1] not in self.location_stop_words | CLAUSE_WORDS \
+                        and not self.datapoint_start.match(' '.join(bare_words[j + 1:])):
+                    locations.append([])
+                    continue
+                if bare in self.location_stop_words or len(locations[-1]) == 4 \
+                        or self.datapoint_start.match(' '.join(bare_words[j:])):
+                    break
+                locations[-1].append(word.rstrip('?!'))
+                if word[-1] in '?!':
+                    break
+            locations = [' '.join(location).strip(' ,.') for location in locations]
+            locations = [location for location in locations if location]
+            if word == 'compare' and locations and self.is_place is not None and not self.is_place(locations[0]):
+                continue
+            if locations:
+                return locations
+        return []
+
+    def extract_date(self, text, todays_date):
+        """Returns the relative date term, '' when the requested day is outside the forecast range, None if unsure."""
+        if any(phrase in text for phrase in TWO_DAY_PHRASES):
+            return 'two days'
+        if re.search(r'\btomorrow\b', text):
+            return 'tomorrow'
+        if re.search(r'\b(?:today|tonight|now)\b', text):
+            return 'today'
+        today_index = self.day_of_the_week_mapping[todays_date.strftime('%A').lower()]
+        days = [day for day in self.day_of_the_week_mapping if re.search(r'\b' + day + r'\b', text)]
+        if len(days) > 1:
+            return None
+        if days:
+            delta = (self.day_of_the_week_mapping[days[0]] - today_index) % 7
+            for term, term_delta in self.data_date_constraint.items():
+                if term_delta == delta:
+                    return term
+            return ''
+        return 'today'
+
+    def count_dates(self, text):
+        """Distinct days named outside of a range phrase, 'today or tomorrow' names two."""
+        for phrases, _ in SPAN_PHRASES.values():
+            for phrase in phrases:
+                text = text.replace(phrase, ' ')
+        days = set()
+        for phrase in TWO_DAY_PHRASES:
+            if phrase in text:
+                days.add('two days')
+                text = text.replace(phrase, ' ')
+        days.update('today' if day in ('tonight', 'now') else day for day in self.date_pattern.findall(text))
+        return len(days)
+
+    def extract_time(self, text):
+        text = LEADING_GREETING_PATTERN.sub('', text)
+        for pattern, label in self.time_patterns:
+            if pattern.search(text):
+                return label
+        return ''
+
+    def extract_datapoints(self, text):
+        matched = []
+        for pattern, parents in self.keyword_patterns:
+            match = pattern.search(text)
+            if match:
+                # blank out the match so 'temperature' is not matched again inside 'average temperature'
+                text = pattern.sub(lambda m: ' ' * len(m.group(0)), text)
+                if all(parents is not other for _, other in matched):
+                    matched.append((match.start(), parents))
+        return [parents for _, parents in sorted(matched, key=lambda item: item[0])]
+
+    def extract_span(self, text):
+        for through, (phrases, _) in SPAN_PHRASES.items():
+            if any(phrase in text for phrase in phrases):
+                return through
+        return ''
+
+    def extract_aggregate(self, text, labels, through):
+        """Returns the aggregate for a range or extreme question, None for a point lookup and False if unsure."""
+        threshold = THRESHOLD_PATTERN.search(text)
+        op = next((AGGREGATE_WORDS[word] for word in text.split() if word in AGGREGATE_WORDS), None)
+        if threshold:
+            op = 'first_below' if threshold.group(1) in ('below', 'under', 'less than') else 'first_above'
+        if not threshold and not through and not any(parent == 'hourly' for parent, _ in labels):
+            return None
+        if not op and not through:
+            return None
+        for parent, key in labels:
+            if parent == 'daily':
+                key_op = next((agg for prefix, agg in DAILY_KEY_AGGREGATES.items() if key.startswith(prefix)), None)
+                if key_op is None or threshold:
+                    return False
+                op = op or key_op
+            elif parent == 'hourly' and key not in NUMERIC_HOURLY_FIELDS:
+                return False
+        if op is None:
+            return False
+        return {"op": op, "through": through, "threshold": int(threshold.group(2)) if threshold else None}
+
+    def choose_label(self, parents, date, time, ranged=False):
+        if 'daily' in parents and not (ranged and 'hourly' in parents):
+            return ['daily', parents['daily']]
+        if time or date != 'today' or ranged or 'general' not in parents:
+            return ['hourly', parents['hourly']] if 'hourly' in parents else None
+        return ['general', parents['general']]
+
+    def unit_suffix(self, parent, key):
+        return UNIT_SUFFIXES.get(self.ontology[parent].get(key, ''), '')
+
+    def build_response_template(self, labels, location, date, time, aggregate=None):
+        date_phrase = DATE_PHRASES.get(date, '')
+        if aggregate and aggregate['through']:
+            date_phrase = SPAN_PHRASES[aggregate['through']][1]
+        when = ' '.join(phrase for phrase in (date_phrase, TIME_PHRASES.get(time, '')) if phrase)
+        facts = []
+        for parent, key in labels:
+            phrase = DATAPOINT_PHRASES.get(key, key.replace('chances_of_', 'chance of ').replace('_', ' '))
+            unit = self.unit_suffix(parent, key)
+            if aggregate and aggregate['op'].startswith('first_'):
+                direction = 'above' if aggregate['op'] == 'first_above' else 'below'
+                facts.append(f'the {phrase} first goes {direction} {aggregate["threshold"]}{unit} {{{key}}}')
+            elif aggregate and parent == 'hourly':
+                facts.append(f'the {AGGREGATE_PHRASES[aggregate["op"]]} {phrase} is {{{key}}}{unit}')
+            else:
+                facts.append(f'the {phrase} is {{{key}}}{unit}')
+        if len(facts) > 1:
+            facts = [', '.join(facts[:-1]) + ' and ' + facts[-1]]
+        return f'In {location} {when}, {facts[0]}.'.replace('  ', ' ')
+
+    def parse(self, user_input, todays_date):
+        text = ' '.join(re.sub(r"[^\w\s',]", ' ', user_input.lower()).split())
+        # 'more than 50%' is a threshold, not a comparison that needs the LLM
+        words = set(THRESHOLD_PATTERN.sub(' ', text).replace(',', ' ').split())
+        datapoints = self.extract_datapoints(text)
+        locations = self.extract_locations(user_input)
+        location = locations[0] if locations else None
+        if len(locations) > 1:
+            words -= COMPARE_WORDS
+
+        if not datapoints and not location:
+            if self.goodbye_pattern.search(text):
+                thanks = 'thank' in text
+                return self.result('goodbye', 1.0 if len(words) <= 8 else 0.6, complete=True,
+                                   response=("You're welcome! " if thanks else '') + 'Goodbye and stay dry out there!')
+            if words and words <= GREETING_WORDS:
+                return self.result('greeting', 1.0, response="Hello! Ask me about the weather anywhere, for example "
+                                                             "'Will it rain tomorrow afternoon in Berlin?'")
+            return None
+
+        confidence = 1.0
+        if words & LOW_CONFIDENCE_WORDS:
+            confidence -= 0.5
+        if not datapoints or not location:
+            # missing slots are still left to the LLM, it phrases the follow up question
+            confidence -= 0.5
+        elif len(locations) > 1 and any(',' in place for place in locations):
+            # 'Rome, Oslo and Lima' or 'Berlin, Germany and London', the commas are ambiguous
+            confidence -= 0.5
+        elif self.is_place is not None and not all(self.is_place(place) for place in locations):
+            # 'in Narnia', a span that is not a known place may not be a place at all
+            confidence -= 0.5
+        if CLOCK_TIME_PATTERN.search(user_input.lower()) or self.count_dates(text) > 1:
+            # 'at 5pm' or 'today or tomorrow' would be answered for the wrong slot or one of the days only
+            confidence -= 0.5
+        date = self.extract_date(text, todays_date)
+        if date is None:
+            confidence -= 0.5
+        if confidence < self.confidence_threshold:
+            return None
+        if date == '':
+            return self.result('get_weather', confidence, location=location, locations=locations,
+                               response='I can only look up the weather for today, tomorrow and the day after. '
+                                        'Could you ask about a day within that range?')
+
+        time = self.extract_time(text)
+        through = self.extract_span(text)
+        if through:
+            date = 'today'
+        ranged = bool(through or THRESHOLD_PATTERN.search(text) or set(text.split()) & set(AGGREGATE_WORDS))
+        labels = [self.choose_label(parents, date, time, ranged) for parents in datapoints]
+        if None in labels:
+            return None
+        aggregate = self.extract_aggregate(text, labels, through)
+        if aggregate is False:
+            return None
+        if aggregate is None:
+            # the aggregate words only hinted at an hourly label, retry as a plain lookup
+            labels = [self.choose_label(parents, date, time) for parents in datapoints]
+            if None in labels:
+                return None
+        if any(parent == 'hourly' for parent, _ in labels) and not time and not aggregate:
+            time = 'noon'
+        locations = [(place.upper() if len(place) <= 3 else place.title()) if place.islower() else place
+                     for place in locations]
+        return self.result('get_weather', confidence, labels=labels, date=date, time=time, location=locations[0],
+                           locations=locations, complete=True, aggregate=aggregate,
+                           response=self.build_response_template(labels, self.template_location(locations), date,
+                                                                 time, aggregate))
+
+    def template_location(self, locations):
+        # several locations share one template, construct_reply fills {location} for each of them
+        return locations[0] if len(locations) == 1 else '{location}'
+
+    def result(self, intent, confidence, labels=None, date='', time='', location='', locations=None, complete=False,
+               aggregate=None, response=''):
+        if confidence < self.confidence_threshold:
+            return None
+        return {
+            "ontology_labels": labels or [],
+            "intent": intent,
+            "date": date,
+            "time": time,
+            "location": location,
+            "locations": locations or [],
+            "complete": complete,
+            "aggregate": aggregate,
+            "response": response
+        }
@@ -0,0 +1,233 @@
+import re
+import json
+from string import Formatter
+
+from forecast_view import AGGREGATE_OPS, NUMERIC_HOURLY_FIELDS, NUMERIC_DAILY_FIELDS
+
+
+INTENTS = ['get_weather', 'greeting', 'goodbye', 'unknown']
+
+
+class QueryDecodeError(ValueError):
+    """
+    A model reply that could not be decoded or validated. The field name drives a targeted re-ask
+    that only asks the model to correct that field instead of retrying the whole extraction.
+    """
+    field = None
+
+    def __init__(self, message, value=None, allowed=None):
+        super().__init__(message)
+        self.value = value
+        self.allowed = allowed
+
+    def reask_prompt(self):
+        prompt = f'Your previous reply was invalid: {self}.'
+        if self.allowed:
+            prompt += f' Allowed values for "{self.field}": {json.dumps(self.allowed)}.'
+        return prompt + ' Reply with the corrected JSON object only, keep every other field unchanged.'
+
+
+class MalformedJSONError(QueryDecodeError):
+    field = 'json'
+
+
+class MissingFieldError(QueryDecodeError):
+    field = 'fields'
+
+
+class InvalidOntologyLabelError(QueryDecodeError):
+    field = 'ontology_labels'
+
+
+class InvalidIntentError(QueryDecodeError):
+    field = 'intent'
+
+
+class InvalidDateTermError(QueryDecodeError):
+    field = 'date'
+
+
+class InvalidTimeLabelError(QueryDecodeError):
+    field = 'time'
+
+
+class InvalidLocationError(QueryDecodeError):
+    field = 'location'
+
+
+class InvalidResponseTemplateError(QueryDecodeError):
+    field = 'response'
+
+
+class InvalidAggregateError(QueryDecodeError):
+    field = 'aggregate'
+
+
+class QueryDecoder:
+    """
+    JSON schema for the structured output mode of extract_query, and a single pass decoder that validates
+    the reply against the ontology, intents, relative date terms and time of day labels.
+    """
+    def __init__(self, ontology, time_of_day_mapping, data_date_constraint, intents=INTENTS, max_locations=5):
+        self.ontology = ontology
+        self.max_locations = max_locations
+        self.intents = intents
+        self.date_terms = list(data_date_constraint)
+        self.time_labels = list(time_of_day_mapping)
+        self.response_format = {
+            "type": "json_schema",
+            "json_schema": {"name": "parsed_query_data", "strict": True, "schema": self.schema()}
+        }
+
+    def schema(self):
+        label_values = list(self.ontology) + sorted({key for keys in self.ontology.values() for key in keys})
+        return {
+            "type": "object",
+            "properties": {
+                "ontology_labels": {
+                    "type": "array",
+                    "items": {"type": "array", "items": {"type": "string", "enum": label_values}}
+                },
+                "intent": {"type": "string", "enum": self.intents},
+                "date": {"type": "string", "enum": [''] + self.date_terms},
+                "time": {"type": "string", "enum": [''] + self.time_labels},
+                "location": {"type": "string"},
+                "locations": {"type": "array", "items": {"type": "string"}},
+                "complete": {"type": "boolean"},
+                "aggregate": {
+                    "anyOf": [
+                        {"type": "null"},
+                        {
+                            "type": "object",
+                            "properties": {
+                                "op": {"type": "string", "enum": list(AGGREGATE_OPS)},
+                                "through": {"type": "string", "enum": [''] + self.date_terms},
+                                "threshold": {"type": ["number", "null"]}
+                            },
+                            "required": ["op", "through", "threshold"],
+                            "additionalProperties": False
+                        }
+                    ]
+                },
+                "response": {"type": "string"}
+            },
+            "required": ["ontology_labels", "intent", "date", "time", "location", "locations", "complete",
+                         "aggregate", "response"],
+            "additionalProperties": False
+        }
+
+    def decode(self, content):
+        if not content:
+            raise MalformedJSONError('the reply was empty')
+        try:
+            parsed = json.loads(content)
+        except json.JSONDecodeError as e:
+            raise MalformedJSONError(f'the reply is not valid JSON ({e.msg} at position {e.pos})')
+        if not isinstance(parsed, dict):
+            raise MalformedJSONError('the reply must be a JSON object')
+        # aggregate was added after the other fields, a reply without it is a plain point lookup
+        parsed.setdefault('aggregate', None)
+        parsed.setdefault('locations', [])
+        missing = [field for field in self.schema()['required'] if field not in parsed]
+        if missing:
+            raise MissingFieldError(f'missing fields {missing}', value=missing)
+
+        labels = parsed['ontology_labels']
+        if not isinstance(labels, list):
+            raise InvalidOntologyLabelError('ontology_labels must be a list of [parent, key] pairs', value=labels)
+        for label in labels:
+            if not (isinstance(label, list) and len(label) == 2 and label[0] in self.ontology
+                    and label[1] in self.ontology[label[0]]):
+                raise InvalidOntologyLabelError(f'{label!r} is not a [parent, key] pair from the ontology',
+                                                value=label)
+        if parsed['intent'] not in self.intents:
+            raise InvalidIntentError(f'unknown intent {parsed["intent"]!r}', value=parsed['intent'],
+                                     allowed=self.intents)
+        if parsed['date'] not in [''] + self.date_terms:
+            raise InvalidDateTermError(f'unknown relative date term {parsed["date"]!r}', value=parsed['date'],
+                                       allowed=[''] + self.date_terms)
+        if parsed['time'] not in [''] + self.time_labels:
+            raise InvalidTimeLabelError(f'unknown time of day label {parsed["time"]!r}', value=parsed['time'],
+                                        allowed=[''] + self.time_labels)
+        if not isinstance(parsed['complete'], bool):
+            raise MalformedJSONError('complete must be a boolean', value=parsed['complete'])
+        if not isinstance(parsed['location'], str):
+            raise InvalidLocationError('location must be a string', value=parsed['location'])
+        parsed['locations'] = self.decode_locations(parsed['location'], parsed['locations'])
+        if parsed['locations']:
+            parsed['location'] = parsed['locations'][0]
+
+        if parsed['complete'] and parsed['intent'] == 'get_weather':
+            if not labels:
+                raise InvalidOntologyLabelError('a complete get_weather query needs at least one ontology label')
+            if not parsed['date']:
+                raise InvalidDateTermError('a complete get_weather query needs a date', allowed=self.date_terms)
+            if not parsed['locations']:
+                raise InvalidLocationError('a complete get_weather query needs a location')
+            # aggregates without a time of day reduce over whole days
+            if not parsed['time'] and not parsed['aggregate'] and any(parent == 'hourly' for parent, _ in labels):
+                raise InvalidTimeLabelError('hourly ontology labels need a time of day label',
+                                            allowed=self.time_labels)
+
+        if parsed['aggregate'] is not None:
+            parsed['aggregate'] = self.decode_aggregate(parsed['aggregate'], parsed['date'], labels)
+
+        parsed['response'] = self.decode_response(parsed['response'], {key for _, key in labels} | {'location'})
+        return parsed
+
+    def decode_locations(self, location, locations):
+        if not isinstance(locations, list) or not all(isinstance(item, str) for item in locations):
+            raise InvalidLocationError('locations must be a list of strings', value=locations)
+        if not locations and location.strip():
+            locations = [location]
+        unique = {}
+        for item in locations:
+            if item.strip():
+                unique.setdefault(' '.join(item.lower().replace(',', ' ').split()), item.strip())
+        if len(unique) > self.max_locations:
+            raise InvalidLocationError(f'at most {self.max_locations} locations can be answered at once, '
+                                       f'got {len(unique)}', value=locations)
+        return list(unique.values())
+
+    def decode_aggregate(self, aggregate, date, labels):
+        if not isinstance(aggregate, dict) or set(aggregate) != {'op', 'through', 'threshold'}:
+            raise InvalidAggregateError('aggregate must be null or an object with op, through and threshold',
+                                        value=aggregate)
+        if aggregate['op'] not in AGGREGATE_OPS:
+            raise InvalidAggregateError(f'unknown aggregate op {aggregate["op"]!r}', value=aggregate['op'],
+                                        allowed=list(AGGREGATE_OPS))
+        through = aggregate['through']
+        if through not in [''] + self.date_terms:
+            raise InvalidAggregateError(f'unknown relative date term {through!r} in aggregate.through',
+                                        value=through, allowed=[''] + self.date_terms)
+        if through and date and self.date_terms.index(through) < self.date_terms.index(date):
+            raise InvalidAggregateError(f'aggregate.through {through!r} is before the date {date!r}', value=through)
+        threshold = aggregate['threshold']
+        if aggregate['op'].startswith('first_'):
+            if isinstance(threshold, bool) or not isinstance(threshold, (int, float)):
+                raise InvalidAggregateError(f'{aggregate["op"]} needs a numeric threshold', value=threshold)
+        for parent, key in labels:
+            if parent == 'hourly' and key not in NUMERIC_HOURLY_FIELDS:
+                raise InvalidAggregateError(f'{[parent, key]!r} can not be aggregated with {aggregate["op"]}',
+                                            value=[parent, key], allowed=sorted(NUMERIC_HOURLY_FIELDS))
+            if parent == 'daily' and (key not in NUMERIC_DAILY_FIELDS or aggregate['op'].startswith('first_')):
+                raise InvalidAggregateError(f'{[parent, key]!r} can not be aggregated with {aggregate["op"]}',
+                                            value=[parent, key], allowed=sorted(NUMERIC_DAILY_FIELDS))
+        return aggregate
+
+    def decode_response(self, response, keys):
+        if not isinstance(response, str) or not response.strip():
+            raise InvalidResponseTemplateError('response must be a non empty string', value=response)
+        # the model sometimes quotes the injection or uses square brackets, repair only known keys
+        response = re.sub(r'"\{(\w+)\}"', r'{\1}', response)
+        response = re.sub(r'\[(\w+)\]', lambda m: '{' + m.group(1) + '}' if m.group(1) in keys else m.group(0),
+                          response)
+        try:
+            placeholders = {name for _, name, _, _ in Formatter().parse(response) if name is not None}
+        except ValueError as e:
+            raise InvalidResponseTemplateError(f'response is not a valid template ({e})', value=response)
+        unknown = placeholders - keys
+        if unknown:
+            raise InvalidResponseTemplateError(f'response uses placeholders {sorted(unknown)} that are not in '
+                                               f'ontology_labels', value=response, allowed=sorted(keys))
+        return response
@@ -0,0 +1,156 @@
+import time
+import asyncio
+import threading
+
+from resilience import RateLimiter
+
+
+REFRESH_TOP_N = 20
+# a hot forecast is refetched once it expires within this many seconds
+REFRESH_LEAD_SECONDS = 60
+REFRESH_INTERVAL_SECONDS = 15
+REFRESH_CONCURRENCY = 2
+REFRESH_RATE_PER_SECOND = 1.0
+# popularity halves every half life, so yesterday's hot set cools down
+REFRESH_HALF_LIFE_SECONDS = 1800
+REFRESH_MAX_TRACKED = 1024
+
+
+class HotLocationRefresher:
+    """
+    Keeps the most asked for locations warm. Every answered location bumps its popularity score, and every
+    interval_seconds the top_n locations whose cached forecast expires within lead_seconds (or is already gone)
+    are refetched on the background loop, at most concurrency at a time and rate_per_second on average.
+    Sessions keep answering from the cache meanwhile, at most slightly stale, instead of waiting on the
+    upstream. top_n=0 turns it off.
+    """
+    def __init__(self, background_loop, top_n=REFRESH_TOP_N, lead_seconds=REFRESH_LEAD_SECONDS,
+                 interval_seconds=REFRESH_INTERVAL_SECONDS, concurrency=REFRESH_CONCURRENCY,
+                 rate_per_second=REFRESH_RATE_PER_SECOND, half_life_seconds=REFRESH_HALF_LIFE_SECONDS,
+                 max_tracked=REFRESH_MAX_TRACKED):
+        self.background_loop = background_loop
+        self.top_n = top_n
+        self.lead_seconds = lead_seconds
+        self.interval_seconds = interval_seconds
+        self.concurrency = concurrency
+        self.rate_per_second = rate_per_second
+        self.half_life_seconds = half_life_seconds
+        self.max_tracked = max_tracked
+        # key -> [score, refresh, expires_in], refresh is a coroutine function and expires_in a function
+        self._tracked = {}
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._decayed_at = time.monotonic()
+        self._task = None
+        self._semaphore = None
+        self._rate_limiter = None
+        self.refreshed = 0
+        self.failed = 0
+
+    @property
+    def enabled(self):
+        return self.top_n > 0
+
+    def record(self, key, refresh, expires_in):
+        """
+        Counts one ask for key. refresh refetches its forecast, expires_in returns the seconds until the cached
+        forecast expires (negative once stale) or None when it is not cached. Both are kept until the location
+        cools down, so they hold the process wide fetcher and cache, never a session.
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self._tracked.get(key)
+            if entry is None:
+                if len(self._tracked) >= self.max_tracked:
+                    # forget the coldest location to make room
+                    del self._tracked[min(self._tracked, key=lambda tracked: self._tracked[tracked][0])]
+                entry = self._tracked[key] = [0.0, refresh, expires_in]
+            entry[0] += 1
+            # the latest callbacks win, they belong to a live session
+            entry[1], entry[2] = refresh, expires_in
+            start = self._task is None
+            if start:
+                self._task = self.background_loop.submit(self._run())
+        if start:
+            print(f'Refreshing the {self.top_n} most asked for locations every {self.interval_seconds}s')
+
+    def hot(self):
+        with self._lock:
+            now = time.monotonic()
+            factor = 0.5 ** ((now - self._decayed_at) / self.half_life_seconds)
+            self._decayed_at = now
+            for entry in self._tracked.values():
+                entry[0] *= factor
+            ranked = sorted(self._tracked.items(), key=lambda item: item[1][0], reverse=True)
+            return [(key, entry[1], entry[2]) for key, entry in ranked[:self.top_n]]
+
+    def submit(self, key, refresh):
+        """
+        Refetches key in the background, unless a refresh for it is already queued or running.
+        """
+        with self._lock:
+            if key in self._pending:
+                return None
+            self._pending.add(key)
+        return self.background_loop.submit(self._refresh(key, refresh))
+
+    async def _refresh(self, key, refresh):
+        try:
+            if self._semaphore is None:
+                # created on the background loop, which runs every refresh
+                self._semaphore = asyncio.Semaphore(self.concurrency)
+                self._rate_limiter = RateLimiter(self.rate_per_second, burst=self.concurrency)
+            async with self._semaphore:
+                await self._rate_limiter.acquire()
+                await refresh()
+            with self._lock:
+                self.refreshed += 1
+        except Exception as e:
+            with self._lock:
+                self.failed += 1
+            print(f"Error refreshing the forecast for {key}: {type(e).__name__} - {e}")
+        finally:
+            with self._lock:
+                self._pending.discard(key)
+
+    async def tick(self):
+        due = []
+        for key, refresh, expires_in in self.hot():
+            remaining = expires_in()
+            if remaining is None or remaining < self.lead_seconds:
+                due.append(self.submit(key, refresh))
+        due = [asyncio.wrap_future(future) for future in due if future is not None]
+        if due:
+            await asyncio.gather(*due)
+        return len(due)
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await self.tick()
+            except Exception as e:
+                print(f"Error in the forecast refresher: {type(e).__name__} - {e}")
+
+    def stop(self, timeout=5):
+        # cancelled before the background loop stops, a pending task would be reported as destroyed at exit
+        with self._lock:
+            task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                task.result(timeout)
+            except BaseException:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {
+                "top_n": self.top_n,
+                "tracked": len(self._tracked),
+                "pending": len(self._pending),
+                "refreshed": self.refreshed,
+                "failed": self.failed,
+                "rate_limited_seconds": self._rate_limiter.waited if self._rate_limiter else 0.0
+            }
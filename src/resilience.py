@@ -0,0 +1,277 @@
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+
+
+class DeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpenError(RuntimeError):
+    pass
+
+
+class Deadline:
+    """
+    Time budget for one user request, shared by every upstream call made while answering it.
+    """
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = time.monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires_at - time.monotonic())
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures and rejects calls for reset_seconds,
+    then lets a single trial call through (half open) to decide whether to close again.
+    """
+    def __init__(self, name, failure_threshold=5, reset_seconds=30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return 'half_open'
+        return 'open'
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == 'open' or (state == 'half_open' and self.trial_in_flight):
+                raise CircuitOpenError(f'{self.name} circuit is open, skipping the call')
+            if state == 'half_open':
+                self.trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def release_trial(self):
+        with self._lock:
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+class LatencyTracker:
+    def __init__(self, window=200):
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self.samples.append(seconds)
+
+    def percentile(self, percentile):
+        with self._lock:
+            if not self.samples:
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(percentile * len(ordered)))]
+
+
+class Upstream:
+    """
+    Resilient caller for one upstream service: deadline aware retries with full jitter exponential backoff,
+    a circuit breaker, and optional hedging that fires a second identical request once the first one has been
+    slower than the hedge_percentile of recent latencies.
+    """
+    def __init__(self, name, retry_on=(), retry_if=None, max_attempts=3, base_delay=0.25, max_delay=2.0,
+                 failure_threshold=5, reset_seconds=30, hedge_percentile=None, hedge_min_samples=20):
+        self.name = name
+        # a callable is only resolved when a call first fails, so the client library can be imported lazily
+        self._retry_on = retry_on
+        # decides on any other exception, e.g. a 5xx reply is transient where a 404 is not
+        self.retry_if = retry_if
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = CircuitBreaker(name, failure_threshold, reset_seconds)
+        self.latency = LatencyTracker()
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+
+    @property
+    def retry_on(self):
+        if callable(self._retry_on):
+            self._retry_on = tuple(self._retry_on())
+        return tuple(self._retry_on) + (asyncio.TimeoutError,)
+
+    def transient(self, error):
+        return isinstance(error, self.retry_on) or (self.retry_if is not None and self.retry_if(error))
+
+    def hedge_delay(self):
+        if self.hedge_percentile is None or len(self.latency.samples) < self.hedge_min_samples:
+            return None
+        return self.latency.percentile(self.hedge_percentile)
+
+    async def _hedged(self, factory):
+        delay = self.hedge_delay()
+        first = asyncio.ensure_future(factory())
+        if delay is None:
+            return await first
+        tasks = {first}
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                self.hedges += 1
+                tasks.add(asyncio.ensure_future(factory()))
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                if not tasks:
+                    return done.pop().result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def call(self, factory, deadline):
+        """
+        factory returns a fresh coroutine per attempt, so it can be retried and hedged.
+        """
+        self.calls += 1
+        for attempt in range(self.max_attempts):
+            remaining = deadline.remaining()
+            if remaining <= 0:
+                raise DeadlineExceeded(f'{self.name} call ran out of its {deadline.seconds}s budget')
+            self.breaker.before_call()
+            start = time.monotonic()
+            try:
+                result = await asyncio.wait_for(self._hedged(factory), timeout=remaining)
+            except asyncio.CancelledError:
+                self.breaker.release_trial()
+                raise
+            except Exception as e:
+                if not self.transient(e):
+                    # the upstream answered, but not with a result: neither a failure nor a success
+                    self.breaker.release_trial()
+                    raise
+                self.breaker.record_failure()
+                backoff = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                if attempt == self.max_attempts - 1 or backoff >= deadline.remaining():
+                    if deadline.expired:
+                        raise DeadlineExceeded(f'{self.name} call ran out of its {deadline.seconds}s budget') from e
+                    raise
+                print(f"{self.name} attempt {attempt + 1} failed: {type(e).__name__} - {e}, retrying in {backoff:.2f}s")
+                self.retries += 1
+                await asyncio.sleep(backoff)
+            else:
+                self.breaker.record_success()
+                self.latency.record(time.monotonic() - start)
+                return result
+
+    def stats(self):
+        p50 = self.latency.percentile(0.5)
+        p95 = self.latency.percentile(0.95)
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "hedges": self.hedges,
+            "circuit": self.breaker.state,
+            "p50_ms": None if p50 is None else 1000 * p50,
+            "p95_ms": None if p95 is None else 1000 * p95
+        }
+
+
+class SingleFlight:
+    """
+    Registry of in flight calls: concurrent callers with the same key share one call instead of each issuing
+    their own. The call runs on the background loop, so it is shared across Streamlit sessions (each on its own
+    thread and loop) and outlives a caller that gives up or is cancelled. Keys are tuples, key[0] names the
+    kind of call for the metrics.
+    """
+    def __init__(self, background_loop):
+        self.background_loop = background_loop
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.counts = {}
+
+    async def _run(self, key, factory):
+        try:
+            return await factory()
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+
+    async def do(self, key, factory, deadline=None):
+        with self._lock:
+            counts = self.counts.setdefault(key[0], {"calls": 0, "coalesced": 0})
+            counts["calls"] += 1
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self.background_loop.submit(self._run(key, factory))
+                self._flights[key] = flight
+            else:
+                counts["coalesced"] += 1
+        shared = asyncio.wrap_future(flight)
+        # nobody may be left waiting when it fails, mark its exception as retrieved
+        shared.add_done_callback(lambda f: f.cancelled() or f.exception())
+        try:
+            # shielded, cancelling one waiter must not cancel the call for the others
+            return await asyncio.wait_for(asyncio.shield(shared), None if deadline is None else deadline.remaining())
+        except asyncio.TimeoutError:
+            if deadline is not None and deadline.expired:
+                raise DeadlineExceeded(f'{key[0]} call ran out of its {deadline.seconds}s budget')
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                kind: dict(counts, in_flight=sum(1 for key in self._flights if key[0] == kind),
+                           coalesced_rate=counts["coalesced"] / counts["calls"] if counts["calls"] else 0.0)
+                for kind, counts in self.counts.items()
+            }
+
+
+class RateLimiter:
+    """
+    Token bucket: calls go through at rate_per_second on average, up to burst of them back to back.
+    acquire() waits for a token, the bucket is only used from a single event loop.
+    """
+    def __init__(self, rate_per_second, burst=1):
+        self.rate_per_second = rate_per_second
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.waited = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate_per_second)
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            delay = (1 - self.tokens) / self.rate_per_second
+            self.waited += delay
+            await asyncio.sleep(delay)
@@ -0,0 +1,194 @@
+import re
+import json
+
+from prompt_compiler import count_tokens
+from query_parser import WEATHER_KEYWORDS, TWO_DAY_PHRASES, GREETING_WORDS
+from query_schema import MalformedJSONError, MissingFieldError, InvalidOntologyLabelError, InvalidDateTermError, \
+    InvalidLocationError
+
+
+# the required slots of a get_weather query, asked for in this order
+SLOT_ORDER = ('location', 'date', 'ontology_labels')
+SLOT_QUESTIONS = {
+    'location': 'Which town or city should I check?',
+    'date': 'I can only look up the weather for today, tomorrow and the day after. Which day should I check?',
+    'ontology_labels': 'What would you like to know about the weather, for example the temperature or the '
+                       'chance of rain?'
+}
+SLOT_RULES = {
+    'location': 'the place name as the user wrote it: a town, city, region or coordinates',
+    'date': 'the relative date term, "" when the asked day is more than two days from today',
+    'ontology_labels': 'a list of [parent, key] pairs from the ontology below, general unless a time of day or a '
+                       'daily phenomenon is asked for'
+}
+# a bare follow up answer naming a place is at most this many words
+SLOT_MAX_LOCATION_WORDS = 4
+
+
+def missing_slot(state):
+    """
+    The first required slot an incomplete get_weather query lacks, None when there is nothing to ask for.
+    """
+    if state.get('intent') != 'get_weather' or state.get('complete'):
+        return None
+    return next((slot for slot in SLOT_ORDER if not state.get(slot)), None)
+
+
+class SlotFiller:
+    """
+    Fills the slot the bot asked for ('Berlin' after 'Which town or city should I check?') and merges it into the
+    conversation state locally, instead of sending the whole state, ontology and rules back for a full extraction.
+    The local parser is tried first. Otherwise the model is asked for that slot only, with a prompt compiled per
+    slot that carries the ontology only when the missing slot is the datapoints.
+    """
+    def __init__(self, prompt_compiler, query_parser):
+        self.prompt_compiler = prompt_compiler
+        self.query_parser = query_parser
+        self.model = prompt_compiler.model
+        self.date_terms = list(prompt_compiler.data_date_constraint)
+        self.ontology = prompt_compiler.ontology
+        self.date_pattern = re.compile(r'\b(?:' + '|'.join(
+            re.escape(phrase) for phrase in self.date_terms + list(TWO_DAY_PHRASES)
+            + list(prompt_compiler.day_of_the_week_mapping) + ['tonight', 'now']) + r')\b')
+        # [parent, key] -> the datapoint under every parent it exists in, e.g. general and hourly temperature
+        self.label_parents = {(parent, key): parents
+                              for _, parents in WEATHER_KEYWORDS for parent, key in parents.items()}
+        self.static_prefixes = {slot: self.compile_static_prefix(slot) for slot in SLOT_ORDER}
+        self.response_formats = {slot: {"type": "json_schema",
+                                        "json_schema": {"name": f'slot_{slot}', "strict": True,
+                                                        "schema": self.schema(slot)}}
+                                 for slot in SLOT_ORDER}
+
+    def compile_static_prefix(self, slot):
+        prefix = ('You are operating as a weather chat bot. The bot asked the user for the one detail missing from '
+                  'their weather question, fill it from their answer. Reply with a JSON object: "answered" is false '
+                  'when the input does not answer the question (a new question, small talk, a goodbye), "value" is '
+                  f'{SLOT_RULES[slot]}.')
+        if slot == 'date':
+            prefix += f'\nRelative date terms: {", ".join(self.date_terms)}'
+        if slot == 'ontology_labels':
+            prefix += ('\nWeather data ontology, one line per parent key and unit ([C/F] is Celsius/Fahrenheit):\n'
+                       f'{self.prompt_compiler.compile_ontology()}')
+        return prefix
+
+    def schema(self, slot):
+        if slot == 'location':
+            value = {"type": "string"}
+        elif slot == 'date':
+            value = {"type": "string", "enum": [''] + self.date_terms}
+        else:
+            label_values = list(self.ontology) + sorted({key for keys in self.ontology.values() for key in keys})
+            value = {"type": "array", "items": {"type": "array", "items": {"type": "string", "enum": label_values}}}
+        return {
+            "type": "object",
+            "properties": {"answered": {"type": "boolean"}, "value": value},
+            "required": ["answered", "value"],
+            "additionalProperties": False
+        }
+
+    def compile_request(self, slot, user_input, todays_date, day_of_week):
+        lines = [f'Today: {day_of_week} {todays_date.strftime("%Y-%m-%d")}'] if slot == 'date' else []
+        lines.append(f'Bot asked: {json.dumps(SLOT_QUESTIONS[slot])}')
+        lines.append(f'User input: {json.dumps(user_input, ensure_ascii=False)}')
+        return '\n'.join(lines)
+
+    def token_stats(self):
+        return {slot: {"static_prefix_tokens": count_tokens(prefix, self.model)}
+                for slot, prefix in self.static_prefixes.items()}
+
+    def decode(self, slot, content):
+        """
+        The slot value from the model reply, None when the input did not answer the question.
+        """
+        try:
+            parsed = json.loads(content or '')
+        except json.JSONDecodeError as e:
+            raise MalformedJSONError(f'the reply is not valid JSON ({e.msg} at position {e.pos})')
+        if not isinstance(parsed, dict) or 'answered' not in parsed or 'value' not in parsed:
+            raise MissingFieldError('the reply must be an object with "answered" and "value"', value=parsed)
+        if not parsed['answered']:
+            return None
+        value = parsed['value']
+        if slot == 'location':
+            if not isinstance(value, str) or not value.strip():
+                raise InvalidLocationError('location must be a non empty string', value=value)
+            return value.strip()
+        if slot == 'date':
+            if value not in [''] + self.date_terms:
+                raise InvalidDateTermError(f'unknown relative date term {value!r}', value=value,
+                                           allowed=[''] + self.date_terms)
+            return value
+        if not isinstance(value, list) or not value:
+            raise InvalidOntologyLabelError('ontology_labels must be a non empty list of [parent, key] pairs',
+                                            value=value)
+        for label in value:
+            if not (isinstance(label, list) and len(label) == 2 and label[0] in self.ontology
+                    and label[1] in self.ontology[label[0]]):
+                raise InvalidOntologyLabelError(f'{label!r} is not a [parent, key] pair from the ontology',
+                                                value=label)
+        return value
+
+    def parse(self, slot, user_input, state, todays_date, is_place):
+        """
+        Every slot the answer names, locally, or None unless it names the asked for slot. is_place tells a bare
+        answer ('Berlin') that is a known place from one that is not an answer at all ('no idea').
+        """
+        text = ' '.join(re.sub(r"[^\w\s',]", ' ', user_input.lower()).split())
+        filled = {}
+        locations = self.query_parser.extract_locations(user_input)
+        if not locations and slot == 'location':
+            bare = user_input.strip(' .,!?')
+            words = bare.split()
+            if 0 < len(words) <= SLOT_MAX_LOCATION_WORDS and not set(text.split()) & GREETING_WORDS \
+                    and not self.query_parser.extract_datapoints(text) and is_place(bare):
+                locations = [bare]
+        if locations:
+            filled['location'] = locations[0]
+            filled['locations'] = locations
+        if self.date_pattern.search(text):
+            # '' is a day out of range, the date question is asked again without the model
+            date = self.query_parser.extract_date(text, todays_date)
+            if date is not None:
+                filled['date'] = date
+        time = self.query_parser.extract_time(text)
+        if time:
+            filled['time'] = time
+        datapoints = self.query_parser.extract_datapoints(text)
+        if datapoints:
+            date = filled.get('date') or state['date'] or 'today'
+            labels = [self.query_parser.choose_label(parents, date, filled.get('time') or state['time'])
+                      for parents in datapoints]
+            if None not in labels:
+                filled['ontology_labels'] = labels
+        return filled if slot in filled else None
+
+    def merge(self, state, filled):
+        """
+        The conversation state with the filled slots. Once no required slot is missing the query is complete and
+        gets a response template, otherwise the response asks for the next missing slot.
+        """
+        state = dict(state, **filled)
+        if 'location' in filled and 'locations' not in filled:
+            state['locations'] = [filled['location']]
+        slot = next((slot for slot in SLOT_ORDER if not state[slot]), None)
+        if slot is not None:
+            state['response'] = SLOT_QUESTIONS[slot]
+            return state
+        if state['date'] != 'today' or state['time']:
+            state['ontology_labels'] = [self.relabel(label, state['date'], state['time'])
+                                        for label in state['ontology_labels']]
+        if any(parent == 'hourly' for parent, _ in state['ontology_labels']) and not state['time'] \
+                and not state['aggregate']:
+            state['time'] = 'noon'
+        state['complete'] = True
+        state['response'] = self.query_parser.build_response_template(
+            state['ontology_labels'], self.query_parser.template_location(state['locations']), state['date'],
+            state['time'], state['aggregate'])
+        return state
+
+    def relabel(self, label, date, time):
+        # current conditions do not answer for a later day or a time of day, their hourly twin does
+        parents = self.label_parents.get(tuple(label))
+        if label[0] != 'general' or parents is None:
+            return label
+        return self.query_parser.choose_label(parents, date, time) or label
@@ -0,0 +1,198 @@
+import json
+import html
+import asyncio
+import streamlit as st
+import nest_asyncio
+
+from chat_history import ChatHistory, HISTORY_MAX_TURNS, HISTORY_PAGE_SIZE
+from weather_core import WeatherBot
+
+# imported once per process, unlike the weather_bot.py script Streamlit re-executes on every rerun
+nest_asyncio.apply()
+
+# the reply is shown right away, a GIF that is not cached yet gets this long to arrive
+GIF_WAIT_SECONDS = 2
+
+# emojize(':cloud_with_lightning::robot::cloud_with_lightning: ...', language='alias'), without importing emoji
+TITLE = "\U0001F329\uFE0F\U0001F916\U0001F329\uFE0F Weather Chat Bot \U0001F329\uFE0F\U0001F916\U0001F329\uFE0F"
+
+
+class StreamlitWeatherBot(WeatherBot):
+    """
+    Streamlit chat front end over the UI free WeatherBot core, api keys come from st.secrets.
+    The session keeps the last history_max_turns turns and a rerun renders history_page_size of them,
+    older pages only on request. One bot is kept per session (see weather_bot.py), so secrets are read once
+    per session and the configuration below once per process.
+    """
+    css_bubble_style = """
+        <style>
+        .chat-container {
+            display: flex;
+            flex-direction: column;
+            width: 100%;
+            max-width: 600px;
+            margin: 0 auto;
+        }
+
+        .chat-bubble {
+            border-radius: 20px;
+            padding: 10px 20px;
+            margin: 5px 0;
+            max-width: 80%;
+            word-wrap: break-word;
+        }
+
+        .user-bubble {
+            align-self: flex-end;
+            background-color: #DCF8C6;
+            color: #000;
+        }
+
+        .bot-bubble {
+            align-self: flex-start;
+            background-color: #ECECEC;
+            color: #000;
+        }
+
+        .gif-image {
+            max-width: 100%;
+            height: auto;
+            border-radius: 10px;
+            margin-top: 10px;
+        }
+        </style>
+    """
+
+    def __init__(self, openai_api_key=None, giphy_api_key=None, history_max_turns=HISTORY_MAX_TURNS,
+                 history_page_size=HISTORY_PAGE_SIZE, **kwargs):
+        super().__init__(openai_api_key=openai_api_key or st.secrets.api_keys.OPENAI_API_KEY,
+                         giphy_api_key=giphy_api_key or st.secrets.api_keys.GIPHY_API_KEY, **kwargs)
+        self.history_max_turns = history_max_turns
+        self.history_page_size = history_page_size
+
+    @staticmethod
+    def submit_input():
+        # the field is cleared once submitted, so a rerun (paging the history, the debug panel) does not
+        # answer the same input again
+        st.session_state['input_text'] = st.session_state['input']
+        st.session_state['input'] = ""
+
+    async def get_input(self):
+        st.text_input("Ask me about the weather! (You can compare up to five locations at a time)", key="input",
+                      max_chars=100, on_change=self.submit_input)
+        input_text = st.session_state['input_text']
+        st.session_state['input_text'] = ""
+        return input_text
+
+    @staticmethod
+    def show_older_turns():
+        st.session_state['history_pages'] += 1
+
+    def render_history(self, message):
+        """
+        Renders the newest pages of the history only, so a rerun costs the same however long the session is.
+        """
+        history = st.session_state['history']
+        shown = st.session_state['history_pages'] * self.history_page_size
+        pending = []
+        for turn, user_input, bot_response, condition in history.latest(shown):
+            message(user_input, key=str(turn), avatar_style="big-smile")
+            message(bot_response, avatar_style="bottts-neutral", is_user=True, key=str(turn) + 'data_by_user')
+            gif_url, future = self.condition_gifs.lookup(condition)
+            if gif_url:
+                self.render_gif(st, gif_url, condition)
+            elif future is not None:
+                pending.append((st.empty(), future, condition))
+        if len(history) > shown:
+            st.button(f'Show older messages ({len(history) - shown} more)', key='show_older',
+                      on_click=self.show_older_turns)
+        elif history.dropped:
+            st.caption(f'{history.dropped} older messages are no longer kept.')
+        return pending
+
+    @staticmethod
+    def render_gif(container, gif_url, condition):
+        container.markdown(f'<img class="gif-image" src="{html.escape(gif_url)}" '
+                           f'alt="{html.escape(condition.lower().replace("_", " "))}">', unsafe_allow_html=True)
+
+    async def fill_gifs(self, pending):
+        """
+        Fills the placeholders of GIFs that were not cached, once the text of every turn is on the page. A GIF that
+        takes longer than GIF_WAIT_SECONDS is left out, it is cached for the next rerun.
+        """
+        if not pending:
+            return
+        await asyncio.wait([asyncio.wrap_future(future) for _, future, _ in pending],
+                                     timeout=GIF_WAIT_SECONDS)
+        for placeholder, future, condition in pending:
+            if future.done() and not future.cancelled() and future.exception() is None and future.result():
+                self.render_gif(placeholder, future.result(), condition)
+
+    def render_debug_panel(self):
+        """
+        Sidebar with the spans of the last answer and the process wide metrics, only offered while metrics are on.
+        """
+        if not self.metrics.enabled or not st.sidebar.toggle('Debug panel', key='debug_panel'):
+            return
+        trace = st.session_state.get('last_trace')
+        st.sidebar.subheader('Last answer')
+        if trace:
+            st.sidebar.dataframe([{"stage": span["stage"], "start ms": round(span["start_ms"], 1),
+                                   "ms": round(span["duration_ms"], 1)} for span in trace["spans"]],
+                                 hide_index=True, use_container_width=True)
+            st.sidebar.dataframe(trace["counts"], hide_index=True, use_container_width=True)
+        else:
+            st.sidebar.caption('Ask a question to see where the time goes.')
+        snapshot = self.metrics.snapshot()
+        st.sidebar.subheader('All sessions')
+        st.sidebar.dataframe([{"stage": stage, "count": histogram["count"], "mean ms": round(histogram["mean_ms"], 1)}
+                              for stage, histogram in snapshot["stages"].items()],
+                             hide_index=True, use_container_width=True)
+        for name in ('forecast_cache', 'query_cache'):
+            stats = snapshot["collectors"].get(name, {})
+            st.sidebar.caption(f'{name}: {stats.get("hits", 0)} hits, {stats.get("misses", 0)} misses, '
+                               f'hit rate {stats.get("hit_rate", 0.0):.0%}')
+        st.sidebar.download_button('Metrics JSON', json.dumps(snapshot, default=str), 'weather_bot_metrics.json',
+                                   'application/json')
+        with st.sidebar.expander('Prometheus'):
+            st.code(self.metrics.prometheus(), language='text')
+
+    async def run(self):
+        # streamlit_chat registers its component on import, which needs a running Streamlit server
+        from streamlit_chat import message
+        st.title(TITLE)
+        st.markdown(self.css_bubble_style, unsafe_allow_html=True)
+        print('pycharm test')
+        if 'history' not in st.session_state:
+            st.session_state['history'] = ChatHistory(self.history_max_turns)
+
+        if 'history_pages' not in st.session_state:
+            st.session_state['history_pages'] = 1
+
+        if 'input_text' not in st.session_state:
+            st.session_state['input_text'] = ""
+
+        if 'terminate' not in st.session_state:
+            st.session_state['terminate'] = False
+
+        user_input = await self.get_input()
+
+        if user_input:
+            with st.spinner('Thinking...'):
+                result = await self.answer(user_input, st.session_state)
+            st.session_state['last_trace'] = result['trace']
+            bot_output = result['reply']
+            if result['terminate']:
+                st.session_state['terminate'] = True
+                # the next input starts a new conversation with a new bot
+                st.session_state.pop('bot', None)
+                st.warning("Session terminated. Thank you for using the Weather Chat Bot!")
+                st.stop()
+
+            st.session_state['history'].append(user_input, bot_output, result['condition'])
+            # a new turn goes back to the newest page
+            st.session_state['history_pages'] = 1
+
+        self.render_debug_panel()
+
+        await self.fill_gifs(self.render_history(message))
@@ -0,0 +1,1286 @@
+import re
+import os
+import sys
+import json
+import copy
+import time
+import atexit
+import importlib
+import functools
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from urllib.parse import quote_plus
+
+import asyncio
+
+from forecast_store import ForecastStore
+from metrics import Metrics, NULL_TRACE
+from gazetteer import Gazetteer, UnknownLocationError, GAZETTEER_PATH
+from forecast_view import HourlyStore, view_for
+from prompt_compiler import PromptCompiler
+from query_parser import LocalQueryParser, DATE_PHRASES
+from query_schema import QueryDecoder, QueryDecodeError
+from refresher import HotLocationRefresher, REFRESH_TOP_N
+from resilience import Deadline, DeadlineExceeded, CircuitOpenError, Upstream, SingleFlight
+from slot_filling import SlotFiller, missing_slot
+
+REQUEST_BUDGET_SECONDS = 20
+
+# multi location questions, at most MAX_LOCATIONS per query and LOCATION_FANOUT forecast fetches in flight
+MAX_LOCATIONS = 5
+LOCATION_FANOUT = 4
+
+FORECAST_CACHE_TTL_SECONDS = 600
+FORECAST_CACHE_MAX_ENTRIES = 256
+# an expired forecast is still served for this long while it is refetched in the background
+FORECAST_CACHE_STALE_SECONDS = 300
+# optional SQLite file shared by every worker process on the host, off unless the path is set
+FORECAST_STORE_PATH = os.environ.get('WEATHER_BOT_FORECAST_STORE')
+
+# number of most asked for locations kept warm, 0 turns the background refresher off
+FORECAST_REFRESH_TOP_N = int(os.environ.get('WEATHER_BOT_REFRESH_TOP_N', REFRESH_TOP_N))
+
+# alias table that maps free text locations to canonical places and coordinates
+LOCATION_GAZETTEER_PATH = os.environ.get('WEATHER_BOT_GAZETTEER', GAZETTEER_PATH)
+
+# per stage spans, token and cache counters, off unless asked for; a port also serves them for scraping
+METRICS_PORT = int(os.environ.get('WEATHER_BOT_METRICS_PORT') or 0)
+METRICS_ENABLED = os.environ.get('WEATHER_BOT_METRICS', '0') not in ('', '0') or bool(METRICS_PORT)
+
+QUERY_CACHE_TTL_SECONDS = 3600
+QUERY_CACHE_MAX_ENTRIES = 1024
+QUERY_CACHE_STATE_FIELDS = ('intent', 'location', 'date', 'time', 'ontology_labels')
+
+WEATHER_MAX_CONNECTIONS = 20
+WEATHER_KEEPALIVE_SECONDS = 60
+WEATHER_REQUEST_TIMEOUT_SECONDS = 10
+
+OPENAI_MAX_CONNECTIONS = 20
+OPENAI_KEEPALIVE_SECONDS = 60
+OPENAI_REQUEST_TIMEOUT_SECONDS = 30
+
+GIPHY_SEARCH_URL = 'https://api.giphy.com/v1/gifs/search'
+GIPHY_MAX_CONNECTIONS = 4
+GIPHY_KEEPALIVE_SECONDS = 60
+GIPHY_REQUEST_TIMEOUT_SECONDS = 5
+# a couple of dozen conditions, each GIF is kept for a day; a failed search is retried after a few minutes
+CONDITION_GIF_CACHE_TTL_SECONDS = 24 * 3600
+CONDITION_GIF_CACHE_MAX_ENTRIES = 64
+CONDITION_GIF_RETRY_SECONDS = 300
+
+
+def normalize_location(location):
+    return ' '.join(location.lower().replace(',', ' ').split())
+
+
+def normalize_query(user_input):
+    return ' '.join(re.sub(r"[^\w\s',]", ' ', user_input.lower()).split())
+
+
+class TTLCache:
+    """
+    Thread safe LRU cache whose entries expire after ttl_seconds. Expired entries stay readable through
+    get_stale for another stale_seconds. Streamlit serves every session from its own thread, so all access
+    goes through the lock.
+    """
+    def __init__(self, ttl_seconds=FORECAST_CACHE_TTL_SECONDS, max_entries=FORECAST_CACHE_MAX_ENTRIES,
+                 stale_seconds=0):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            now = time.monotonic()
+            if expires_at <= now:
+                if expires_at + self.stale_seconds <= now:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def get_stale(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] + self.stale_seconds <= time.monotonic():
+                return None
+            self._entries.move_to_end(key)
+            self.stale_hits += 1
+            return entry[1]
+
+    def expires_in(self, key):
+        # seconds until key expires, negative once it is stale, None when it is not cached
+        with self._lock:
+            entry = self._entries.get(key)
+            return None if entry is None else entry[0] - time.monotonic()
+
+    def put(self, key, value, ttl_seconds=None):
+        with self._lock:
+            ttl_seconds = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+            self._entries[key] = (time.monotonic() + ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "stale_hits": self.stale_hits,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0
+            }
+
+
+class CachedForecast:
+    """
+    Re-readable view of a python_weather Forecast. DailyForecast pops 'astronomy' out of the shared json when it is
+    built, so Forecast.daily_forecasts can only be iterated once; the built days are kept here instead.
+    """
+    def __init__(self, forecast):
+        self.forecast = forecast
+        self._hourly_store = None
+        self.daily_forecasts = list(forecast.daily_forecasts)
+        # HourlyForecast renames tempC/tempF in the shared json on first use, do it once here
+        # so sessions reading the cached forecast concurrently never race on that mutation
+        for daily_forecast in self.daily_forecasts:
+            for _ in daily_forecast.hourly_forecasts:
+                pass
+
+    @property
+    def hourly_store(self):
+        if self._hourly_store is None:
+            self._hourly_store = HourlyStore.from_forecast(self)
+        return self._hourly_store
+
+    def __getattr__(self, name):
+        return getattr(self.forecast, name)
+
+
+class BackgroundLoop:
+    """
+    Event loop running on a daemon thread for the lifetime of the process.
+    Every Streamlit rerun calls asyncio.run on a brand new loop, and pooled connections are bound to
+    the loop that opened them, so long lived clients are owned and driven from here instead.
+    """
+    def __init__(self, name='weather-bot-io'):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name=name, daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def run(self, coro):
+        # awaitable from any other loop, cancelling the caller cancels the coroutine on the background loop
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stop(self, timeout=5):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self._thread.join(timeout)
+
+
+class BackgroundClient(ABC):
+    """
+    A pooled client driven from the background loop. Subclasses release their connections in _close(), which
+    close() runs on the loop at shutdown.
+    """
+    name = 'client'
+
+    @abstractmethod
+    async def _close(self):
+        pass
+
+    def close(self, timeout=5):
+        if self.background_loop.loop.is_running():
+            try:
+                self.background_loop.submit(self._close()).result(timeout)
+            except Exception as e:
+                print(f"Error closing {self.name}: {type(e).__name__} - {e}")
+
+
+class WeatherClientManager(BackgroundClient):
+    """
+    One python_weather.Client for the whole process, backed by a pooled keep-alive aiohttp session
+    so a query costs a single request on a warm connection instead of a new HTTP session + TLS handshake.
+    """
+    name = 'weather client'
+
+    def __init__(self, background_loop, unit=None, max_connections=WEATHER_MAX_CONNECTIONS,
+                 keepalive_seconds=WEATHER_KEEPALIVE_SECONDS, timeout_seconds=WEATHER_REQUEST_TIMEOUT_SECONDS,
+                 base_url=None):
+        self.background_loop = background_loop
+        self.unit = unit
+        # python_weather always calls https://wttr.in, base_url points the same requests at a wttr.in compatible host
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self.timeout_seconds = timeout_seconds
+        self._client = None
+        self._session = None
+
+    async def _get_client(self):
+        # only ever called on the background loop, so no locking is needed around the lazy init
+        if self._client is None:
+            aiohttp = lazy_import('aiohttp')
+            python_weather = lazy_import('python_weather')
+            self.unit = self.unit or python_weather.METRIC
+            connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                             limit_per_host=self.max_connections,
+                                             keepalive_timeout=self.keepalive_seconds,
+                                             ttl_dns_cache=300,
+                                             ssl=False)  # python_weather's own default session skips verification too
+            session = aiohttp.ClientSession(connector=connector,
+                                            timeout=aiohttp.ClientTimeout(total=self.timeout_seconds))
+            self._client = python_weather.Client(unit=self.unit, session=session)
+            self._session = session
+        return self._client
+
+    async def _fetch(self, location, unit):
+        client = await self._get_client()
+        if self.base_url is None:
+            return await client.get(location, unit=unit or self.unit)
+        async with self._session.get(f'{self.base_url}/{quote_plus(location)}?format=j1') as resp:
+            resp.raise_for_status()
+            python_weather = lazy_import('python_weather')
+            return python_weather.forecast.Forecast(await resp.json(), unit or self.unit,
+                                                    python_weather.Locale.ENGLISH)
+
+    async def get(self, location, unit=None):
+        return await self.background_loop.run(self._fetch(location, unit))
+
+    async def _close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class OpenAIClientManager(BackgroundClient):
+    """
+    One AsyncOpenAI client for the whole process with a pooled httpx connection pool.
+    Completions are awaited on the background loop, so the multi second round trip never blocks
+    the Streamlit loop or other sessions.
+    """
+    name = 'OpenAI client'
+
+    def __init__(self, background_loop, max_connections=OPENAI_MAX_CONNECTIONS,
+                 keepalive_seconds=OPENAI_KEEPALIVE_SECONDS, timeout_seconds=OPENAI_REQUEST_TIMEOUT_SECONDS,
+                 base_url=None, api_key=None):
+        self.background_loop = background_loop
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self.timeout_seconds = timeout_seconds
+        self._client = None
+
+    async def _get_client(self):
+        # created lazily on the background loop, without an api_key AsyncOpenAI reads OPENAI_API_KEY
+        if self._client is None:
+            httpx = lazy_import('httpx')
+            http_client = httpx.AsyncClient(limits=httpx.Limits(max_connections=self.max_connections,
+                                                                max_keepalive_connections=self.max_connections,
+                                                                keepalive_expiry=self.keepalive_seconds),
+                                            timeout=self.timeout_seconds)
+            # retries are handled by the openai Upstream so they share the request deadline
+            self._client = lazy_import('openai').AsyncOpenAI(http_client=http_client, timeout=self.timeout_seconds, max_retries=0,
+                                       base_url=self.base_url, api_key=self.api_key)
+        return self._client
+
+    async def _create_chat_completion(self, **kwargs):
+        client = await self._get_client()
+        return await client.chat.completions.create(**kwargs)
+
+    async def create_chat_completion(self, **kwargs):
+        return await self.background_loop.run(self._create_chat_completion(**kwargs))
+
+    async def _close(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+
+class ConditionGifs(BackgroundClient):
+    """
+    One Giphy GIF per weather condition, the python_weather Kind name a reply is about (e.g. 'LIGHT_RAIN').
+    There are only a couple of dozen conditions, so nearly every lookup is a cache hit. A miss is searched on the
+    background loop over one pooled aiohttp session, concurrent misses for a condition share one request, and
+    the caller never waits for it. Without an api key there are no GIFs.
+    """
+    name = 'GIF client'
+
+    def __init__(self, background_loop, api_key=None, single_flight=None, cache=None, base_url=GIPHY_SEARCH_URL,
+                 max_connections=GIPHY_MAX_CONNECTIONS, keepalive_seconds=GIPHY_KEEPALIVE_SECONDS,
+                 timeout_seconds=GIPHY_REQUEST_TIMEOUT_SECONDS, retry_seconds=CONDITION_GIF_RETRY_SECONDS):
+        self.background_loop = background_loop
+        self.api_key = api_key
+        self.single_flight = single_flight or SingleFlight(background_loop)
+        # an empty url is a cached miss, no GIF for that condition until it expires
+        self.cache = cache or TTLCache(ttl_seconds=CONDITION_GIF_CACHE_TTL_SECONDS,
+                                       max_entries=CONDITION_GIF_CACHE_MAX_ENTRIES)
+        self.base_url = base_url
+        self.max_connections = max_connections
+        self.keepalive_seconds = keepalive_seconds
+        self.timeout_seconds = timeout_seconds
+        self.retry_seconds = retry_seconds
+        self._session = None
+        self.fetched = 0
+        self.failed = 0
+
+    @property
+    def enabled(self):
+        return bool(self.api_key)
+
+    def lookup(self, condition):
+        """
+        The cached GIF url for condition and None, or None and the concurrent future of its search.
+        """
+        if not self.enabled or not condition:
+            return None, None
+        url = self.cache.get(condition)
+        if url is not None:
+            return url or None, None
+        return None, self.background_loop.submit(self.single_flight.do(('gif', condition),
+                                                                       lambda: self._fetch(condition)))
+
+    def _get_session(self):
+        # only ever called on the background loop
+        if self._session is None:
+            aiohttp = lazy_import('aiohttp')
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=self.keepalive_seconds,
+                                             ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  timeout=aiohttp.ClientTimeout(total=self.timeout_seconds))
+        return self._session
+
+    async def _fetch(self, condition):
+        params = {'api_key': self.api_key, 'q': f"{condition.lower().replace('_', ' ')} weather", 'limit': 1,
+                  'rating': 'g'}
+        try:
+            async with self._get_session().get(self.base_url, params=params) as resp:
+                resp.raise_for_status()
+                found = (await resp.json()).get('data') or []
+            url = found[0]['images']['fixed_height']['url'] if found else ''
+        except Exception as e:
+            # the request url carries the api key, only the error type and status are printed
+            print(f"Error searching a GIF for {condition}: {type(e).__name__}, status {getattr(e, 'status', None)}")
+            self.failed += 1
+            url = ''
+        else:
+            self.fetched += 1
+        self.cache.put(condition, url, None if url else self.retry_seconds)
+        return url or None
+
+    async def _close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    def stats(self):
+        return dict(self.cache.stats(), enabled=self.enabled, fetched=self.fetched, failed=self.failed)
+
+
+_shared = {}
+_shared_lock = threading.RLock()
+
+
+def lazy_import(name):
+    """
+    openai (with httpx) and python_weather (with aiohttp) take most of the cold start, they are imported on first use
+    instead of with this module: the Streamlit page renders before they load, and openai only loads once a question
+    needs the LLM.
+    """
+    return importlib.import_module(name)
+
+
+def openai_errors():
+    # no openai error can be raised before openai was imported
+    openai = sys.modules.get('openai')
+    return (openai.APIError,) if openai is not None else ()
+
+
+def shared(name, factory):
+    """
+    One instance per process for name. This module is imported, not re-executed, on Streamlit reruns,
+    so the instances are shared by every session and rerun as well as by batch workers.
+    """
+    with _shared_lock:
+        if name not in _shared:
+            _shared[name] = factory()
+        return _shared[name]
+
+
+def get_background_loop():
+    def create():
+        background_loop = BackgroundLoop()
+        # atexit runs last-registered first, so the clients below are closed before the loop stops
+        atexit.register(background_loop.stop)
+        return background_loop
+    return shared('background_loop', create)
+
+
+def get_weather_client_manager():
+    def create():
+        manager = WeatherClientManager(get_background_loop())
+        atexit.register(manager.close)
+        return manager
+    return shared('weather_client_manager', create)
+
+
+def get_openai_client_manager(api_key=None):
+    def create():
+        manager = OpenAIClientManager(get_background_loop(), api_key=api_key)
+        atexit.register(manager.close)
+        return manager
+    return shared('openai_client_manager', create)
+
+
+class QueryPathStats:
+    """
+    Hit counts and latency of the query understanding paths (local parser vs LLM).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.paths = {}
+
+    def record(self, path, seconds):
+        with self._lock:
+            stats = self.paths.setdefault(path, {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["count"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def stats(self):
+        with self._lock:
+            total = sum(stats["count"] for stats in self.paths.values())
+            return {
+                path: {
+                    "count": stats["count"],
+                    "hit_rate": stats["count"] / total,
+                    "avg_ms": 1000 * stats["total_seconds"] / stats["count"],
+                    "max_ms": 1000 * stats["max_seconds"]
+                } for path, stats in self.paths.items()
+            }
+
+
+def get_forecast_store(path=FORECAST_STORE_PATH, ttl_seconds=FORECAST_CACHE_TTL_SECONDS):
+    if not path:
+        return None
+
+    def create():
+        store = ForecastStore(path, ttl_seconds=ttl_seconds)
+        atexit.register(store.close)
+        return store
+    return shared(('forecast_store', path), create)
+
+
+def get_metrics(enabled=METRICS_ENABLED, port=METRICS_PORT):
+    def create():
+        metrics = Metrics(enabled=enabled)
+        if enabled and port:
+            try:
+                metrics.serve(port)
+            except OSError as e:
+                # another worker process on the host already serves it
+                print(f"Error serving metrics on port {port}: {type(e).__name__} - {e}")
+        return metrics
+    return shared(('metrics', enabled), create)
+
+
+def get_gazetteer(path=LOCATION_GAZETTEER_PATH):
+    return shared(('gazetteer', path), lambda: Gazetteer(path))
+
+
+def get_single_flight():
+    return shared('single_flight', lambda: SingleFlight(get_background_loop()))
+
+
+def get_condition_gifs(api_key=None):
+    def create():
+        condition_gifs = ConditionGifs(get_background_loop(), api_key, get_single_flight())
+        atexit.register(condition_gifs.close)
+        return condition_gifs
+    return shared(('condition_gifs', api_key), create)
+
+
+def get_refresher(top_n=FORECAST_REFRESH_TOP_N):
+    def create():
+        refresher = HotLocationRefresher(get_background_loop(), top_n=top_n)
+        atexit.register(refresher.stop)
+        return refresher
+    return shared(('refresher', top_n), create)
+
+
+def server_error(error):
+    # a wttr.in outage answers 5xx, an unknown location 404
+    return getattr(error, 'status', None) is not None and error.status >= 500 \
+        and isinstance(error, lazy_import('aiohttp').ClientResponseError)
+
+
+def get_upstreams():
+    # circuit breakers and latency percentiles are per upstream and shared by every session
+    return shared('upstreams', lambda: {
+        'openai': Upstream('openai', retry_on=lambda: (lazy_import('openai').APIConnectionError,
+                                                       lazy_import('openai').RateLimitError,
+                                                       lazy_import('openai').InternalServerError),
+                           max_attempts=3, base_delay=0.5, max_delay=4.0),
+        # forecasts are cheap and idempotent, hedge the slowest 5% of them
+        'weather': Upstream('weather', retry_on=lambda: (lazy_import('aiohttp').ClientConnectionError,
+                                                         lazy_import('aiohttp').ClientPayloadError,
+                                                         lazy_import('aiohttp').ContentTypeError),
+                            retry_if=server_error, max_attempts=3, base_delay=0.25, max_delay=2.0,
+                            hedge_percentile=0.95)
+    })
+
+
+def get_query_tools(bot_class, model, empty_state):
+    """
+    The prompt compiler, local parser, decoder and slot filler only read the immutable class configuration, one set
+    per model.
+    """
+    def create():
+        prompt_compiler = PromptCompiler(bot_class.pw_ontology, bot_class.time_of_day_mapping,
+                                         bot_class.day_of_the_week_mapping, bot_class.data_date_constraint,
+                                         empty_state, model=model)
+        gazetteer = get_gazetteer()
+        query_parser = LocalQueryParser(bot_class.pw_ontology, bot_class.time_of_day_mapping,
+                                        bot_class.day_of_the_week_mapping, bot_class.data_date_constraint,
+                                        is_place=lambda place: gazetteer.resolve(place) is not None)
+        return (prompt_compiler, query_parser,
+                QueryDecoder(bot_class.pw_ontology, bot_class.time_of_day_mapping, bot_class.data_date_constraint,
+                             max_locations=MAX_LOCATIONS),
+                SlotFiller(prompt_compiler, query_parser))
+    return shared(('query_tools', bot_class.__name__, model), create)
+
+
+def get_query_path_stats():
+    return shared('query_path_stats', QueryPathStats)
+
+
+def get_query_cache(ttl_seconds=QUERY_CACHE_TTL_SECONDS, max_entries=QUERY_CACHE_MAX_ENTRIES):
+    return shared(('query_cache', ttl_seconds, max_entries),
+                  lambda: TTLCache(ttl_seconds=ttl_seconds, max_entries=max_entries))
+
+
+def get_forecast_cache(ttl_seconds=FORECAST_CACHE_TTL_SECONDS, max_entries=FORECAST_CACHE_MAX_ENTRIES,
+                       stale_seconds=FORECAST_CACHE_STALE_SECONDS):
+    return shared(('forecast_cache', ttl_seconds, max_entries, stale_seconds),
+                  lambda: TTLCache(ttl_seconds=ttl_seconds, max_entries=max_entries, stale_seconds=stale_seconds))
+
+
+class ForecastFetcher:
+    """
+    Loads a forecast from the shared store or the weather upstream into the forecast cache. It holds only the
+    process wide clients and caches, so the background refresher can keep refreshing a location through it
+    without keeping the session that asked for it alive.
+    """
+    def __init__(self, weather_client, upstreams, forecast_cache, forecast_store, single_flight, gazetteer, metrics,
+                 unit=None, request_budget_seconds=REQUEST_BUDGET_SECONDS):
+        self.weather_client = weather_client
+        self.upstreams = upstreams
+        self.forecast_cache = forecast_cache
+        self.forecast_store = forecast_store
+        self.single_flight = single_flight
+        self.gazetteer = gazetteer
+        self.metrics = metrics
+        # python_weather.METRIC unless given, resolved on first use so python_weather loads lazily
+        self._unit = unit
+        self.request_budget_seconds = request_budget_seconds
+
+    @property
+    def unit(self):
+        if self._unit is None:
+            self._unit = lazy_import('python_weather').METRIC
+        return self._unit
+
+    def upstream_location(self, location):
+        # coordinates of a known place spare the upstream its own geocoding
+        place = self.gazetteer.resolve(location)
+        return location if place is None else f'{place.latitude},{place.longitude}'
+
+    async def refresh(self, location, cache_key, min_remaining=0):
+        deadline = Deadline(self.request_budget_seconds)
+        # a stored forecast about to expire is not worth loading, only one that outlives the refresh lead
+        return await self.single_flight.do(('weather',) + cache_key,
+                                           lambda: self.fetch(location, cache_key, deadline, min_remaining,
+                                                              self.metrics.trace()), deadline)
+
+    async def fetch(self, location, cache_key, deadline, min_remaining=0, trace=NULL_TRACE):
+        if self.forecast_store is not None:
+            # another worker process may have fetched it already
+            with trace.span('forecast_store'):
+                weather = await asyncio.to_thread(self.forecast_store.get, cache_key)
+            remaining = weather.fetched_at + self.forecast_store.ttl_seconds - time.time() if weather else 0
+            if remaining > min_remaining:
+                self.forecast_cache.put(cache_key, weather, min(self.forecast_cache.ttl_seconds, remaining))
+                return weather
+        upstream_location = self.upstream_location(location)
+        with trace.span('weather_upstream'):
+            weather = await self.upstreams['weather'].call(lambda: self.weather_client.get(upstream_location,
+                                                                                            unit=self.unit), deadline)
+            weather = CachedForecast(weather)
+        self.forecast_cache.put(cache_key, weather)
+        if self.forecast_store is not None:
+            self.forecast_store.save_in_background(cache_key, weather)
+        return weather
+
+
+def get_forecast_fetcher(weather_client, upstreams, forecast_cache, forecast_store, single_flight, gazetteer, metrics,
+                         unit=None, request_budget_seconds=REQUEST_BUDGET_SECONDS):
+    """
+    One fetcher per set of clients and caches. The fetcher keeps them referenced, so their ids stay unique for as
+    long as it is shared.
+    """
+    components = (weather_client, upstreams, forecast_cache, forecast_store, single_flight, gazetteer, metrics)
+    return shared(('forecast_fetcher',) + tuple(id(component) for component in components)
+                  + (unit, request_budget_seconds),
+                  lambda: ForecastFetcher(*components, unit=unit, request_budget_seconds=request_budget_seconds))
+
+
+class WeatherBot:
+    """
+    UI free weather bot, configured with plain arguments. Clients, caches, upstream breakers and stats default
+    to the process wide instances, so any number of bots (Streamlit sessions, batch workers) share them.
+    One bot holds one conversation, answer() is the entry point for a single user input.
+    """
+    # immutable configuration, built once per process when the class is defined and shared by every bot
+    time_of_day_mapping = {
+        # window is the (start, stop) slot range aggregate questions reduce over, e.g. 'this afternoon'
+        'midnight': {'time': '00:00:00', 'index': 0, 'window': (0, 1)},
+        'early morning': {'time': '03:00:00', 'index': 1, 'window': (1, 2)},
+        'morning': {'time': '06:00:00', 'index': 2, 'window': (2, 4)},
+        'late morning': {'time': '09:00:00', 'index': 3, 'window': (3, 4)},
+        'noon': {'time': '12:00:00', 'index': 4, 'window': (4, 5)},
+        'afternoon': {'time': '15:00:00', 'index': 5, 'window': (4, 6)},
+        'evening': {'time': '18:00:00', 'index': 6, 'window': (6, 8)},
+        'night': {'time': '21:00:00', 'index': 7, 'window': (7, 8)}
+    }
+
+    day_of_the_week_mapping = {
+        'sunday': 0,
+        'monday': 1,
+        'tuesday':  2,
+        'wednesday':  3,
+        'thursday':  4,
+        'friday': 5,
+        'saturday': 6
+    }
+
+    data_date_constraint = {
+        'today': 0,
+        'tomorrow': 1,
+        'two days': 2
+    }
+
+    pw_ontology = {
+        "hourly": {
+            "chances_of_fog": "int (percent)",
+            "chances_of_frost": "int (percent)",
+            "chances_of_high_temperature": "int (percent)",
+            "chances_of_overcast": "int (percent)",
+            "chances_of_rain": "int (percent)",
+            "chances_of_remaining_dry": "int (percent)",
+            "chances_of_snow": "int (percent)",
+            "chances_of_sunshine": "int (percent)",
+            "chances_of_thunder": "int (percent)",
+            "chances_of_windy": "int (percent)",
+            "cloud_cover": "int (percent)",
+            "hourly_forecast_description": "str",
+            "dew_point": "int (Celsius/Fahrenheit)",
+            "feels_like": "int (Celsius/Fahrenheit)",
+            "heat_index": "Celsius/Fahrenheit",
+            "heat_rating": "HeatIndex",
+            "humidity": "int (percent)",
+            "weather_kind_object": "Kind",
+            "weather_kind_emoji": "str",
+            "weather_kind": "str",
+            "weather_kind_value": "str",  # emoji value???
+            "precipitation": "float (Millimeters/Inches)",
+            "pressure": "float (Pascal/Inches)",
+            "temperature": "int (Celsius/Fahrenheit)",
+            "time": "time",
+            "ultraviolet_object": "UltraViolet",
+            "ultraviolet_index": "int",
+            "ultraviolet_rating": "UltraViolet",
+            "unit_object": "auto",
+            "visibility": "int (Kilometers/Miles)",
+            "wind_chill": "int (Celsius/Fahrenheit)",
+            "wind_direction": "WindDirection",
+            "wind_gust": "int (Kilometers_per_hour/Miles_per_hour)",
+            "wind_speed": "int (Kilometers_per_hour/Miles_per_hour)"
+        },
+        "daily": {
+            "date": "date",
+            "highest_temperature": "int (Celsius/Fahrenheit)",
+            "hourly_forecast_generator": "Iterable[HourlyForecast]",
+            "language": "Locale",
+            "language_value": "Locale",
+            "lowest_temperature": "int (Celsius/Fahrenheit)",
+            "moon_illumination": "int (percent)",
+            "moon_phase_object": "Phase",
+            "moon_phase_emoji": "str",
+            "moon_phase_value": "str",
+            "moonrise_time": "time | None",
+            "moonset_time": "time | None",
+            "total_snowfall": "float (Centimeters/Inches)",
+            "sunlight_hours": "float (hours)",
+            "sunrise_time": "time | None",
+            "sunset_time": "time | None",
+            "average_daily_temperature": "int (Celsius/Fahrenheit)",
+            "measuring_unit_object": "auto"
+        },
+        "general": {
+            "coordinates": "Tuple[float, float]",
+            "country": "str",
+            "daily_forecasts_generator": "Iterable[DailyForecast]",
+            "local_datetime": "datetime",
+            "current_forecast_description": "str",
+            "feels_like": "int (Celsius/Fahrenheit)",
+            "humidity": "int (percent)",
+            "forecast_kind": "Kind",
+            "forecast_kind_emoji": "str",
+            "forecast_kind_value": "str",
+            "local_population": "int",
+            "language": "Locale",
+            "location": "str",
+            "precipitation": "float (Millimeters/Inches)",
+            "pressure": "float (Pascal/Inches)",
+            "region": "str",
+            "temperature": "int (Celsius/Fahrenheit)",
+            "uv_index": "UltraViolet",
+            "uv_rate": "str",
+            "forecast_unit_object": "auto",
+            "visibility": "int (Kilometers/Miles)",
+            "wind_direction_degrees": "int (degrees)",
+            "wind_direction_emoji": "str",
+            "wind_cardinal_direction": "str",
+            "wind_direction_abbr": "str",
+            "wind_speed": "int (KPH/MPH)"
+        }
+    }
+
+    def __init__(self, openai_api_key=None, giphy_api_key=None, weather_client=None, gpt_client=None,
+                 model="gpt-4o", unit=None, request_budget_seconds=REQUEST_BUDGET_SECONDS,
+                 max_reasks=1, forecast_cache=None, query_cache=None, query_path_stats=None, upstreams=None,
+                 forecast_store=None, single_flight=None, refresher=None, gazetteer=None, metrics=None,
+                 condition_gifs=None):
+        self.weather_client = weather_client or get_weather_client_manager()
+        self.terminate = False
+        self.OPENAI_API_KEY = openai_api_key or os.environ.get("OPENAI_API_KEY")
+        self.GIPHY_API_KEY = giphy_api_key or os.environ.get("GIPHY_API_KEY")
+        self.model = model
+        self.max_reasks = max_reasks
+        self.request_budget_seconds = request_budget_seconds
+        self.deadline = None
+        self.upstreams = upstreams or get_upstreams()
+        self.gpt_client = gpt_client or get_openai_client_manager(self.OPENAI_API_KEY)
+        self.forecast_cache = forecast_cache or get_forecast_cache()
+        self.forecast_store = forecast_store or get_forecast_store()
+        self.single_flight = single_flight or get_single_flight()
+        self.refresher = refresher or get_refresher()
+        self.gazetteer = gazetteer or get_gazetteer()
+        self.metrics = metrics or get_metrics()
+        self.condition_gifs = condition_gifs or get_condition_gifs(self.GIPHY_API_KEY)
+        self.forecast_fetcher = get_forecast_fetcher(self.weather_client, self.upstreams, self.forecast_cache,
+                                                     self.forecast_store, self.single_flight, self.gazetteer,
+                                                     self.metrics, unit, request_budget_seconds)
+        self.trace = NULL_TRACE
+        self.todays_date = datetime.now()
+        self.day_of_week = self.todays_date.strftime('%A')
+
+        self.parsed_query_data = {
+                                  "ontology_labels": [],
+                                  "intent": "",
+                                  "date": "",
+                                  "time": "",
+                                  "location": "",
+                                  "locations": [],
+                                  "complete": False,
+                                  "aggregate": None,
+                                  "response": ""
+        }
+
+        self.prompt_compiler, self.query_parser, self.query_decoder, self.slot_filler = \
+            get_query_tools(type(self), self.model, self.reset_conversation_state())
+        self.query_path_stats = query_path_stats or get_query_path_stats()
+        self.query_cache = query_cache or get_query_cache()
+        self.register_collectors()
+
+    @property
+    def unit(self):
+        return self.forecast_fetcher.unit
+
+    @property
+    def awaiting_slot(self):
+        # the conversation state is the slot filling state: an incomplete weather query waits for its missing slot
+        return missing_slot(self.parsed_query_data)
+
+    def register_collectors(self):
+        # read only when a metrics snapshot is taken
+        self.metrics.register('forecast_cache', self.forecast_cache.stats)
+        self.metrics.register('query_cache', self.query_cache.stats)
+        self.metrics.register('query_paths', self.query_path_stats.stats)
+        self.metrics.register('single_flight', self.single_flight.stats)
+        self.metrics.register('refresher', self.refresher.stats)
+        self.metrics.register('condition_gifs', self.condition_gifs.stats)
+        self.metrics.register('upstreams', lambda: {name: upstream.stats() for name, upstream in self.upstreams.items()})
+        prompt_compiler, slot_filler = self.prompt_compiler, self.slot_filler
+        self.metrics.register('prompt_tokens', lambda: dict(prompt_compiler.token_stats(),
+                                                            slots=slot_filler.token_stats()))
+        if self.forecast_store is not None:
+            self.metrics.register('forecast_store', self.forecast_store.stats)
+
+    def forecast_cache_key(self, location):
+        # spellings of a known place share one key, 'nyc' and 'New York City, NY' are both 'us/ny/new-york'
+        place = self.gazetteer.resolve(location)
+        return place.key if place is not None else normalize_location(location), self.unit.temperature
+
+    def request_deadline(self):
+        return self.deadline if self.deadline is not None else Deadline(self.request_budget_seconds)
+
+    async def get_weather(self, location):
+        if not self.gazetteer.plausible(location):
+            raise UnknownLocationError(f'{location!r} is not a place')
+        cache_key = self.forecast_cache_key(location)
+        weather = self.forecast_cache.get(cache_key)
+        if weather is not None:
+            self.trace.count('forecast_cache', outcome='hit')
+            return weather
+        weather = self.forecast_cache.get_stale(cache_key)
+        if weather is not None:
+            self.trace.count('forecast_cache', outcome='stale')
+            # answer from the slightly stale forecast right away, the fresh one is fetched in the background
+            self.refresher.submit(cache_key, functools.partial(self.forecast_fetcher.refresh, location, cache_key,
+                                                               self.refresher.lead_seconds))
+            return weather
+        self.trace.count('forecast_cache', outcome='miss')
+        # concurrent sessions asking for the same location share one fetch
+        deadline = self.request_deadline()
+        return await self.single_flight.do(('weather',) + cache_key,
+                                           lambda: self.forecast_fetcher.fetch(location, cache_key, deadline,
+                                                                               trace=self.trace), deadline)
+
+    def track_location(self, location):
+        # the refresher keeps only the location and the shared fetcher, never this session's bot
+        cache_key = self.forecast_cache_key(location)
+        self.refresher.record(cache_key,
+                              functools.partial(self.forecast_fetcher.refresh, location, cache_key,
+                                                self.refresher.lead_seconds),
+                              functools.partial(self.forecast_cache.expires_in, cache_key))
+
+    def guess_location(self, user_input, session=None):
+        """
+        Cheap local guess used to start the forecast fetch while the LLM is still extracting the query.
+        """
+        location = self.query_parser.extract_location(user_input)
+        if location:
+            return location
+        if self.awaiting_slot == 'location':
+            # a bare known place answers 'Which town or city should I check?'
+            answer = user_input.strip(' .,!?')
+            return answer if self.gazetteer.resolve(answer) is not None else None
+        if self.awaiting_slot is not None:
+            return self.parsed_query_data['location']
+        return (session or {}).get('last_location') or None
+
+    def start_weather_prefetch(self, user_input, session=None):
+        location = self.guess_location(user_input, session)
+        if not location or not self.gazetteer.plausible(location):
+            return None
+        task = asyncio.ensure_future(self.get_weather(location))
+        # a discarded guess may fail (bad location), mark its exception as retrieved
+        task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return location, task
+
+    def discard_weather_prefetch(self, prefetch):
+        if prefetch is not None and not prefetch[1].done():
+            prefetch[1].cancel()
+
+    async def get_weather_with_prefetch(self, location, prefetch):
+        if prefetch is not None:
+            prefetch_location, task = prefetch
+            if self.forecast_cache_key(prefetch_location) == self.forecast_cache_key(location):
+                try:
+                    return await task
+                except Exception as e:
+                    print(f"Prefetch for {prefetch_location} failed: {type(e).__name__} - {e}")
+            else:
+                print(f'Discarding prefetch for {prefetch_location}, extracted location is {location}')
+                self.discard_weather_prefetch(prefetch)
+        return await self.get_weather(location)
+
+    async def get_weathers(self, locations, prefetch=None):
+        """
+        Fetches every location concurrently, at most LOCATION_FANOUT at a time. Returns location -> forecast,
+        or the exception for the locations that failed so the others can still be answered.
+        """
+        fanout = asyncio.Semaphore(LOCATION_FANOUT)
+        prefetch_key = self.forecast_cache_key(prefetch[0]) if prefetch is not None else None
+        if prefetch is not None and prefetch_key not in {self.forecast_cache_key(location) for location in locations}:
+            print(f'Discarding prefetch for {prefetch[0]}, extracted locations are {locations}')
+            self.discard_weather_prefetch(prefetch)
+
+        async def fetch(location):
+            async with fanout:
+                if self.forecast_cache_key(location) == prefetch_key:
+                    return await self.get_weather_with_prefetch(location, prefetch)
+                return await self.get_weather(location)
+
+        results = await asyncio.gather(*(fetch(location) for location in locations), return_exceptions=True)
+        for location, result in zip(locations, results):
+            if isinstance(result, BaseException):
+                print(f"Error: forecast for {location} failed: {type(result).__name__} - {result}")
+        return dict(zip(locations, results))
+
+    async def prompt_gpt(self, messages, response_format=None):
+        """
+        !!!!!!!THIS IS PAID!!!!!!!
+        """
+        options = {"response_format": response_format} if response_format is not None else {}
+        with self.trace.span('prompt_gpt'):
+            completion = await self.upstreams['openai'].call(
+                lambda: self.gpt_client.create_chat_completion(model=self.model, messages=messages, **options),
+                self.request_deadline()
+            )
+        response = completion.choices[0].message.content
+        if completion.usage is not None:
+            # cached_tokens shows how much of the static prompt prefix was served from the provider cache
+            prompt_details = getattr(completion.usage, 'prompt_tokens_details', None)
+            self.trace.count('tokens', completion.usage.prompt_tokens, kind='prompt')
+            self.trace.count('tokens', completion.usage.completion_tokens, kind='completion')
+            self.trace.count('tokens', getattr(prompt_details, 'cached_tokens', None) or 0, kind='cached')
+        return response
+
+    async def extract_query(self, input):
+        prompt = self.prompt_compiler.compile_request(input, self.todays_date, self.day_of_week, self.parsed_query_data)
+        messages = [
+            {"role": "system", "content": self.prompt_compiler.static_prefix},
+            {"role": "user", "content": prompt}
+        ]
+        return await self.prompt_json(messages, self.query_decoder.response_format, self.query_decoder.decode)
+
+    async def prompt_json(self, messages, response_format, decode):
+        for attempt in range(self.max_reasks + 1):
+            response = await self.prompt_gpt(messages, response_format=response_format)
+            try:
+                return decode(response)
+            except QueryDecodeError as e:
+                print(f"Error: {type(e).__name__} - {e}")
+                if attempt == self.max_reasks:
+                    raise
+                # re-ask for the broken field only, the conversation so far stays in the cached prefix
+                messages = messages + [
+                    {"role": "assistant", "content": response or ""},
+                    {"role": "user", "content": e.reask_prompt()}
+                ]
+
+    async def extract_slot(self, slot, user_input):
+        """
+        Asks the model for the missing slot only. Returns the value, or None when the input does not answer
+        the bot's question.
+        """
+        prompt = self.slot_filler.compile_request(slot, user_input, self.todays_date, self.day_of_week)
+        messages = [
+            {"role": "system", "content": self.slot_filler.static_prefixes[slot]},
+            {"role": "user", "content": prompt}
+        ]
+        return await self.prompt_json(messages, self.slot_filler.response_formats[slot],
+                                      lambda response: self.slot_filler.decode(slot, response))
+
+    async def fill_slot(self, user_input, start):
+        """
+        Fills the slot the bot asked for from the follow up and merges it into the conversation state. Returns None
+        when the input is not an answer to the question, it is then understood as a query of its own.
+        """
+        slot = self.awaiting_slot
+        with self.trace.span('slot_parse'):
+            filled = self.slot_filler.parse(slot, user_input, self.parsed_query_data, self.todays_date,
+                                            lambda location: self.gazetteer.resolve(location) is not None)
+        path = 'slot_local'
+        if filled is None:
+            cache_key = ('slot', slot, normalize_query(user_input), self.todays_date.strftime('%Y-%m-%d'))
+            # wrapped, so the answers that are not a value are cached too
+            cached = self.query_cache.get(cache_key)
+            if cached is not None:
+                value, path = cached['value'], 'slot_cache'
+            else:
+                async def extract():
+                    extracted = await self.extract_slot(slot, user_input)
+                    self.query_cache.put(cache_key, {'value': copy.deepcopy(extracted)})
+                    return extracted
+                value, path = await self.single_flight.do(cache_key, extract, self.request_deadline()), 'slot_llm'
+            if value is None:
+                return None
+            filled = {slot: copy.deepcopy(value)}
+        self.trace.count('query_path', path=path)
+        self.query_path_stats.record(path, time.perf_counter() - start)
+        return self.slot_filler.merge(self.parsed_query_data, filled)
+
+    def query_cache_key(self, user_input):
+        # the date is part of the key so relative terms like 'tomorrow' are never served across midnight; of the
+        # state only the slots count, the last reply template would make every finished turn a miss
+        state = json.dumps({field: self.parsed_query_data[field] for field in QUERY_CACHE_STATE_FIELDS},
+                           sort_keys=True)
+        return normalize_query(user_input), self.day_of_week, self.todays_date.strftime('%Y-%m-%d'), state
+
+    async def understand_query(self, user_input):
+        """
+        Tries the local parser first and only pays for a GPT call when it is not confident.
+        GPT results are memoized, the cached template is filled with fresh weather values in construct_reply.
+        """
+        start = time.perf_counter()
+        with self.trace.span('local_parse'):
+            parsed_query_data = self.query_parser.parse(user_input, self.todays_date)
+        if parsed_query_data is not None:
+            self.trace.count('query_path', path='local')
+            self.query_path_stats.record('local', time.perf_counter() - start)
+        elif self.awaiting_slot is not None:
+            # the follow up to the bot's question for a missing slot, only that slot is filled
+            parsed_query_data = await self.fill_slot(user_input, start)
+        if parsed_query_data is None:
+            cache_key = self.query_cache_key(user_input)
+            parsed_query_data = self.query_cache.get(cache_key)
+            if parsed_query_data is not None:
+                # copies both ways, run() mutates the parsed state it is handed
+                parsed_query_data = copy.deepcopy(parsed_query_data)
+                self.trace.count('query_path', path='cache')
+                self.query_path_stats.record('cache', time.perf_counter() - start)
+            else:
+                async def extract():
+                    extracted = await self.extract_query(user_input)
+                    self.query_cache.put(cache_key, copy.deepcopy(extracted))
+                    return extracted
+                # identical concurrent questions share one completion, every waiter gets its own copy
+                parsed_query_data = copy.deepcopy(await self.single_flight.do(('query',) + cache_key, extract,
+                                                                              self.request_deadline()))
+                self.trace.count('query_path', path='llm')
+                self.query_path_stats.record('llm', time.perf_counter() - start)
+        return parsed_query_data
+
+    def describe_slot(self, match, forecast_view):
+        if match is None:
+            return 'at no point'
+        day, slot = match
+        terms = {index: term for term, index in self.data_date_constraint.items()}
+        return f"{DATE_PHRASES[terms[day]]} at {forecast_view.hourly_store.times[slot][:5]}"
+
+    def construct_reply(self, parsed_query_data, forecast_view, location=None):
+        day_index = self.data_date_constraint.get(parsed_query_data['date'].lower(), 0)
+        tod_index = None
+        if parsed_query_data['time']:
+            tod_index = self.time_of_day_mapping[parsed_query_data['time'].lower()]['index']
+        aggregate = parsed_query_data.get('aggregate')
+        dp_values = {}
+        if aggregate:
+            # range questions reduce over every slot of the requested days, or the time of day window
+            through_index = self.data_date_constraint.get(aggregate['through'], day_index)
+            days = slice(day_index, max(day_index, through_index) + 1)
+            slots = slice(None)
+            if parsed_query_data['time']:
+                slots = slice(*self.time_of_day_mapping[parsed_query_data['time'].lower()]['window'])
+            for parent, key in parsed_query_data['ontology_labels']:
+                value = forecast_view.aggregate(parent, key, aggregate['op'], days, slots, aggregate['threshold'])
+                if parent == 'hourly' and aggregate['op'].startswith('first_'):
+                    value = self.describe_slot(value, forecast_view)
+                dp_values[key] = value
+        else:
+            for parent, key in parsed_query_data['ontology_labels']:
+                dp_values[key] = forecast_view.resolve(parent, key, day_index, tod_index)
+        # templates use {location} for the requested place, a ['general', 'location'] label wins if present
+        dp_values.setdefault('location', location or parsed_query_data['location'])
+
+        actual_response = parsed_query_data['response'].format(**dp_values)
+        return actual_response
+
+    def did_you_mean(self, locations):
+        # a close known name is only ever suggested, Bolton is fetched as Bolton and never as Boston
+        places = [place.name for place in map(self.gazetteer.suggest, locations) if place is not None]
+        return f" Did you mean {' or '.join(dict.fromkeys(places))}?" if places else ''
+
+    def construct_replies(self, parsed_query_data, forecasts):
+        """
+        Fills the template once per location. Locations whose forecast failed get an apology instead.
+        """
+        replies = []
+        for location, weather in forecasts.items():
+            if isinstance(weather, UnknownLocationError):
+                replies.append(f"Sorry, I don't know where {location} is.{self.did_you_mean([location])}")
+                continue
+            if isinstance(weather, BaseException):
+                replies.append(f"Sorry, I couldn't get the forecast for {location} right now."
+                               f"{self.did_you_mean([location])}")
+                continue
+            # only the labelled datapoints are extracted, view_for(weather).materialize() dumps them all
+            with self.trace.span('forecast_view'):
+                forecast_view = view_for(weather)
+            with self.trace.span('fill_reply'):
+                reply = self.construct_reply(parsed_query_data, forecast_view, location)
+            if len(forecasts) > 1 and '{location}' not in parsed_query_data['response'] \
+                    and normalize_location(location) not in normalize_location(reply):
+                reply = f'{location}: {reply}'
+            replies.append(reply)
+        return ' '.join(replies)
+
+    def forecast_condition(self, parsed_query_data, forecast_view):
+        """
+        The Kind name of the weather a reply is about: the hourly weather_kind at the asked time of day (noon of a
+        later day), the current forecast_kind otherwise.
+        """
+        day_index = self.data_date_constraint.get(parsed_query_data['date'].lower(), 0)
+        if parsed_query_data['time']:
+            tod_index = self.time_of_day_mapping[parsed_query_data['time'].lower()]['index']
+        elif day_index:
+            tod_index = self.time_of_day_mapping['noon']['index']
+        else:
+            return forecast_view.resolve('general', 'forecast_kind')
+        return forecast_view.resolve('hourly', 'weather_kind', day_index, tod_index)
+
+    def start_condition_gif(self, parsed_query_data, forecasts):
+        """
+        Looks up the GIF for the first answered location, a miss is searched while the reply is put together and
+        rendered. Returns the condition and its url when it was cached.
+        """
+        weather = next(weather for weather in forecasts.values() if not isinstance(weather, BaseException))
+        try:
+            condition = self.forecast_condition(parsed_query_data, view_for(weather))
+        except (KeyError, IndexError) as e:
+            print(f"Error: no condition for the GIF: {type(e).__name__} - {e}")
+            return None, None
+        gif_url, pending = self.condition_gifs.lookup(condition)
+        if self.condition_gifs.enabled:
+            self.trace.count('condition_gif', outcome='hit' if pending is None else 'miss')
+        return condition, gif_url
+
+    def reset_conversation_state(self):
+        parsed_query_data = {
+                              "ontology_labels": [],
+                              "intent": "",
+                              "date": "",
+                              "time": "",
+                              "location": "",
+                              "locations": [],
+                              "complete": False,
+                              "aggregate": None,
+                              "response": self.parsed_query_data['response']
+        }
+        return parsed_query_data
+
+
+    async def answer(self, user_input, session=None):
+        """
+        Answers one user input. session is any mutable mapping kept between the inputs of one conversation
+        (a dict, or st.session_state), it remembers the last location. Returns the reply, the parsed query,
+        whether the conversation ended, the weather condition and its GIF url when cached, the error if one was
+        turned into an apology and the stage timings.
+        """
+        session = session if session is not None else {}
+        start = time.perf_counter()
+        timings = {}
+        offsets = {}
+        error = None
+        condition = gif_url = None
+        # a bot lives as long as its session, relative dates are resolved against the day of this answer
+        self.todays_date = datetime.now()
+        self.day_of_week = self.todays_date.strftime('%A')
+        # one time budget for the whole answer, shared by the LLM and weather calls and their retries
+        self.deadline = Deadline(self.request_budget_seconds)
+        self.trace = self.metrics.trace()
+        # the forecast fetch for a guessed location runs concurrently with the LLM extraction
+        prefetch = self.start_weather_prefetch(user_input, session)
+        filled_slots = self.parsed_query_data
+        try:
+            self.parsed_query_data = await self.understand_query(user_input)
+        except (QueryDecodeError, DeadlineExceeded, CircuitOpenError) + openai_errors() as e:
+            print(f"Error: {type(e).__name__} - {e}")
+            self.discard_weather_prefetch(prefetch)
+            error = e
+        except BaseException:
+            self.discard_weather_prefetch(prefetch)
+            raise
+        timings['understand_query'] = time.perf_counter() - start
+
+        parsed_query_data = self.parsed_query_data
+        if error is not None:
+            if isinstance(error, QueryDecodeError):
+                bot_output = "Sorry, I didn't quite get that. Could you rephrase your weather question?"
+            else:
+                bot_output = "Sorry, I'm having trouble thinking right now. Please try again in a moment."
+        elif parsed_query_data['complete'] and parsed_query_data['intent'] == 'get_weather':
+            mark = time.perf_counter()
+            offsets['get_weather'] = mark - start
+            locations = parsed_query_data['locations'] or [parsed_query_data['location']]
+            forecasts = await self.get_weathers(locations, prefetch)
+            for location, weather in forecasts.items():
+                if not isinstance(weather, BaseException):
+                    self.track_location(location)
+            timings['get_weather'] = time.perf_counter() - mark
+            failed = [weather for weather in forecasts.values() if isinstance(weather, BaseException)]
+            if len(failed) == len(forecasts):
+                error = failed[0]
+                if all(isinstance(weather, UnknownLocationError) for weather in failed):
+                    bot_output = f"Sorry, I don't know where {' or '.join(locations)} is." \
+                                 f"{self.did_you_mean(locations)} Could you tell me the town or city?"
+                    # the rest of the query stands, the next input only has to fill in the location
+                    self.parsed_query_data = dict(parsed_query_data, location='', locations=[], complete=False,
+                                                  response=bot_output)
+                else:
+                    bot_output = f"Sorry, I couldn't get the forecast for {' or '.join(locations)} " \
+                                 f"right now.{self.did_you_mean(locations)} Please try again in a moment."
+            else:
+                mark = time.perf_counter()
+                offsets['construct_reply'] = mark - start
+                session['last_location'] = parsed_query_data['location']
+                condition, gif_url = self.start_condition_gif(parsed_query_data, forecasts)
+                bot_output = self.construct_replies(parsed_query_data, forecasts)
+                timings['construct_reply'] = time.perf_counter() - mark
+                self.parsed_query_data = self.reset_conversation_state()
+        elif parsed_query_data['complete'] and parsed_query_data['intent'] == 'goodbye':
+            self.discard_weather_prefetch(prefetch)
+            bot_output = parsed_query_data['response']
+            self.terminate = True
+        else:
+            self.discard_weather_prefetch(prefetch)
+            bot_output = parsed_query_data['response']
+            if parsed_query_data['intent'] != 'get_weather' and missing_slot(filled_slots) is not None:
+                # small talk in between does not drop the slots filled so far
+                self.parsed_query_data = filled_slots
+
+        timings['total'] = time.perf_counter() - start
+        for stage, seconds in timings.items():
+            self.trace.add(stage, seconds, offsets.get(stage, 0.0))
+        return {
+            "reply": bot_output,
+            "parsed_query_data": parsed_query_data,
+            "terminate": self.terminate,
+            "condition": condition,
+            "gif_url": gif_url,
+            "error": None if error is None else f'{type(error).__name__}: {error}',
+            "timings_ms": {stage: 1000 * seconds for stage, seconds in timings.items()},
+            "trace": self.trace.summary()
+        }
@@ -0,0 +1,85 @@
+import asyncio
+
+from batch import BatchRunner, read_queries
+
+
+class FakeBot:
+    """
+    Answers by echoing, remembers the queries of its conversation and how many answers ran at once.
+    """
+    running = 0
+    peak = 0
+
+    def __init__(self):
+        self.parsed_query_data = self.reset_conversation_state()
+        self.terminate = False
+        self.queries = []
+
+    def reset_conversation_state(self):
+        return {"intent": "", "locations": [], "response": getattr(self, 'parsed_query_data', {}).get('response', '')}
+
+    async def answer(self, query, session):
+        FakeBot.running += 1
+        FakeBot.peak = max(FakeBot.peak, FakeBot.running)
+        try:
+            await asyncio.sleep(0.01)
+            if query == 'boom':
+                raise RuntimeError('upstream down')
+            self.queries.append(query)
+            session['turns'] = session.get('turns', 0) + 1
+            self.parsed_query_data = dict(self.parsed_query_data, response=f'template for {query}')
+            return {"reply": f'{query} #{session["turns"]}', "parsed_query_data": {"intent": "get_weather"},
+                    "timings_ms": {"total": 10.0}}
+        finally:
+            FakeBot.running -= 1
+
+
+def run(lines, concurrency=2):
+    FakeBot.running = FakeBot.peak = 0
+    bots, rows = [], []
+
+    def make_bot():
+        bots.append(FakeBot())
+        return bots[-1]
+    runner = BatchRunner(concurrency, make_bot, rows.append)
+    asyncio.run(runner.run(lines))
+    return runner, bots, sorted(rows, key=lambda row: row['line'])
+
+
+def test_read_queries(tmp_path):
+    path = tmp_path / 'queries.jsonl'
+    path.write_text('"rain in Berlin?"\n\n{"query": "wind in Oslo", "id": "a", "session": "s1"}\nnot json\n'
+                    '{"id": 3}\n')
+    records = list(read_queries(str(path)))
+    assert records[0] == (1, {"query": "rain in Berlin?"}, None)
+    assert records[1] == (3, {"query": "wind in Oslo", "id": "a", "session": "s1"}, None)
+    assert records[2][0] == 4 and records[2][1] is None and records[2][2].startswith('invalid JSON')
+    assert records[3] == (5, None, 'expected a string or an object with a "query" string')
+
+
+def test_a_session_is_answered_in_order_by_one_bot():
+    lines = [(number, {"query": f'q{number}', "session": 's1'}, None) for number in range(1, 5)]
+    runner, bots, rows = run(lines, concurrency=4)
+    assert len(bots) == 1 and bots[0].queries == ['q1', 'q2', 'q3', 'q4']
+    assert [row['reply'] for row in rows] == ['q1 #1', 'q2 #2', 'q3 #3', 'q4 #4']
+    assert FakeBot.peak == 1
+
+
+def test_pooled_bots_are_reused_from_an_empty_state():
+    lines = [(number, {"query": f'q{number}'}, None) for number in range(1, 7)]
+    runner, bots, rows = run(lines, concurrency=2)
+    assert FakeBot.peak <= 2 and len(bots) <= 2
+    assert all(bot.parsed_query_data['response'] == '' for bot in bots)
+    # every session-less query gets a fresh session
+    assert all(row['reply'].endswith('#1') for row in rows)
+    assert runner.answered == 6 and runner.errors == 0
+
+
+def test_errors_and_bad_lines_are_written_and_counted():
+    lines = [(1, {"query": 'boom', "id": 'x'}, None), (2, None, 'invalid JSON (Expecting value)'),
+             (3, {"query": 'ok'}, None)]
+    runner, bots, rows = run(lines)
+    assert rows[0]['id'] == 'x' and rows[0]['error'] == 'RuntimeError: upstream down'
+    assert rows[1] == {"line": 2, "error": 'invalid JSON (Expecting value)'}
+    assert rows[2]['reply'] == 'ok #1' and rows[2]['intent'] == 'get_weather'
+    assert runner.answered == 3 and runner.errors == 2
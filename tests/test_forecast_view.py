@@ -0,0 +1,43 @@
+import numpy as np
+import pytest
+
+from forecast_view import HourlyStore
+from query_schema import QueryDecoder, InvalidAggregateError
+from weather_core import WeatherBot
+
+TIMES = ['00:00:00', '03:00:00', '06:00:00', '09:00:00', '12:00:00', '15:00:00', '18:00:00', '21:00:00']
+
+
+@pytest.fixture
+def store():
+    # it rains at 03:00 and 21:00 on both days
+    rain = np.zeros((2, 8), dtype=np.float32)
+    rain[:, [1, 7]] = 80
+    return HourlyStore({'chances_of_rain': rain}, {}, {}, TIMES)
+
+
+@pytest.mark.parametrize('local_time, slot', [('00:10:00', 0), ('03:00:00', 1), ('18:25:00', 6), ('23:59:00', 7),
+                                              ('N/A', 0)])
+def test_current_slot(store, local_time, slot):
+    assert store.current_slot(local_time) == slot
+
+
+def test_first_where_skips_past_slots_of_today(store):
+    assert store.first_where('chances_of_rain', '>', 50, slice(0, 2)) == (0, 1)
+    assert store.first_where('chances_of_rain', '>', 50, slice(0, 2), from_slot=6) == (0, 7)
+    assert store.first_where('chances_of_rain', '>', 50, slice(0, 2), slice(0, 4), from_slot=6) == (1, 1)
+    # later days are searched from midnight
+    assert store.first_where('chances_of_rain', '>', 50, slice(1, 2), from_slot=6) == (1, 1)
+
+
+@pytest.fixture(scope='module')
+def decoder():
+    return QueryDecoder(WeatherBot.pw_ontology, WeatherBot.time_of_day_mapping, WeatherBot.data_date_constraint)
+
+
+@pytest.mark.parametrize('op', ['max', 'min', 'mean'])
+def test_decode_aggregate_rejects_non_numeric_daily_keys(decoder, op):
+    aggregate = {'op': op, 'through': 'tomorrow', 'threshold': None}
+    with pytest.raises(InvalidAggregateError):
+        decoder.decode_aggregate(aggregate, 'today', [['daily', 'sunrise_time']])
+    assert decoder.decode_aggregate(aggregate, 'today', [['daily', 'highest_temperature']]) == aggregate
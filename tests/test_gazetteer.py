@@ -0,0 +1,34 @@
+import pytest
+
+from gazetteer import Gazetteer
+
+
+@pytest.fixture(scope='module')
+def gazetteer():
+    return Gazetteer()
+
+
+@pytest.mark.parametrize('location, key', [
+    ("Berlin", 'de/berlin'),
+    ("nyc", 'us/ny/new-york'),
+    ("New York City, NY", 'us/ny/new-york'),
+    ("Zürich", 'ch/zurich'),
+])
+def test_resolve_exact_names_and_aliases(gazetteer, location, key):
+    assert gazetteer.resolve(location).key == key
+
+
+# real towns a single edit away from a known city, and typos of one
+@pytest.mark.parametrize('location, suggestion', [
+    ("Bolton", 'Boston'),
+    ("Sidney", 'Sydney'),
+    ("Austen", 'Austin'),
+    ("Barcelna", 'Barcelona'),
+])
+def test_close_names_are_only_suggested(gazetteer, location, suggestion):
+    assert gazetteer.resolve(location) is None
+    assert gazetteer.suggest(location).name == suggestion
+
+
+def test_no_suggestion_for_a_known_place(gazetteer):
+    assert gazetteer.suggest("Boston") is None
@@ -0,0 +1,73 @@
+import json
+import urllib.request
+
+from metrics import Metrics, NULL_TRACE
+
+
+def recorded_metrics():
+    metrics = Metrics(enabled=True, buckets=(0.01, 0.1, 1))
+    trace = metrics.trace()
+    trace.add('understand_query', 0.005)
+    trace.add('understand_query', 0.05)
+    trace.add('get_weather', 2.0)
+    trace.count('query_path', path='local')
+    trace.count('query_path', path='local')
+    trace.count('tokens', 120, kind='prompt')
+    metrics.register('forecast_cache', lambda: {"size": 3, "hit_rate": 0.5, "enabled": True, "path": 'x',
+                                                "nested": {"hits": 2}})
+    return metrics, trace
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False)
+    assert metrics.trace() is NULL_TRACE
+    metrics.register('forecast_cache', lambda: {"size": 1})
+    assert metrics.snapshot() == {"enabled": False, "stages": {}, "counters": [], "collectors": {}}
+
+
+def test_snapshot():
+    metrics, trace = recorded_metrics()
+    snapshot = metrics.snapshot()
+    stage = snapshot['stages']['understand_query']
+    assert stage['count'] == 2 and stage['buckets'] == {0.01: 1, 0.1: 1, 1: 0}
+    # slower than the last bucket, only counted in +Inf
+    assert snapshot['stages']['get_weather']['buckets'] == {0.01: 0, 0.1: 0, 1: 0}
+    assert {"name": 'query_path', "path": 'local', "value": 2} in snapshot['counters']
+    assert snapshot['collectors']['forecast_cache']['size'] == 3
+    assert [span['stage'] for span in trace.summary()['spans']] == ['understand_query', 'understand_query',
+                                                                     'get_weather']
+
+
+def test_a_failing_collector_is_reported_not_raised():
+    metrics = Metrics(enabled=True)
+    metrics.register('broken', lambda: 1 / 0)
+    assert metrics.snapshot()['collectors']['broken'] == {"error": 'ZeroDivisionError: division by zero'}
+
+
+def test_prometheus_text():
+    metrics, _ = recorded_metrics()
+    lines = metrics.prometheus().splitlines()
+    assert 'weather_bot_stage_seconds_bucket{stage="understand_query",le="0.01"} 1' in lines
+    # buckets are cumulative
+    assert 'weather_bot_stage_seconds_bucket{stage="understand_query",le="1"} 2' in lines
+    assert 'weather_bot_stage_seconds_bucket{stage="get_weather",le="+Inf"} 1' in lines
+    assert 'weather_bot_stage_seconds_count{stage="get_weather"} 1' in lines
+    assert 'weather_bot_query_path_total{path="local"} 2' in lines
+    assert 'weather_bot_tokens_total{kind="prompt"} 120' in lines
+    # only numbers are exported, nested stats get dotted names
+    assert 'weather_bot_forecast_cache{stat="hit_rate"} 0.5' in lines
+    assert 'weather_bot_forecast_cache{stat="nested.hits"} 2.0' in lines
+    assert not any('stat="enabled"' in line or 'stat="path"' in line for line in lines)
+
+
+def test_serve():
+    metrics, _ = recorded_metrics()
+    server = metrics.serve(0, host='127.0.0.1')
+    try:
+        base = f'http://127.0.0.1:{server.server_address[1]}'
+        with urllib.request.urlopen(f'{base}/metrics') as response:
+            assert 'weather_bot_query_path_total{path="local"} 2' in response.read().decode()
+        with urllib.request.urlopen(f'{base}/metrics.json') as response:
+            assert json.loads(response.read())['enabled'] is True
+    finally:
+        server.shutdown()
@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import pytest
+
+from query_parser import LocalQueryParser
+from weather_core import WeatherBot, get_gazetteer
+
+# a Sunday
+TODAY = datetime(2026, 10, 18, 12, 0)
+
+
+@pytest.fixture(scope='module')
+def parser():
+    gazetteer = get_gazetteer()
+    return LocalQueryParser(WeatherBot.pw_ontology, WeatherBot.time_of_day_mapping, WeatherBot.day_of_the_week_mapping,
+                            WeatherBot.data_date_constraint, is_place=lambda place: gazetteer.resolve(place) is not None)
+
+
+# question -> (labels, date, time, locations) the local parser answers with, None when it is left to the LLM
+PARSE_CASES = [
+    ("What is the temperature in Berlin today?", ([['general', 'temperature']], 'today', '', ['Berlin'])),
+    ("Will it rain tomorrow afternoon in Berlin?", ([['hourly', 'chances_of_rain']], 'tomorrow', 'afternoon',
+                                                    ['Berlin'])),
+    ("Will it snow in Oslo the day after tomorrow?", ([['hourly', 'chances_of_snow']], 'two days', 'noon', ['Oslo'])),
+    ("What is the lowest temperature in Paris over the next two days?",
+     ([['daily', 'lowest_temperature']], 'today', '', ['Paris'])),
+    ("How windy is it in Berlin tonight?", ([['hourly', 'wind_speed']], 'today', 'night', ['Berlin'])),
+    # a leading greeting is not the asked time of day
+    ("Good morning! What's the temperature in Berlin?", ([['general', 'temperature']], 'today', '', ['Berlin'])),
+    ("good evening, what's the weather in London?",
+     ([['general', 'current_forecast_description']], 'today', '', ['London'])),
+    ("Hi, good morning, will it rain in Berlin this afternoon?",
+     ([['hourly', 'chances_of_rain']], 'today', 'afternoon', ['Berlin'])),
+    # clock times the slots can not answer as asked
+    ("what is the temperature in Berlin at 5pm", None),
+    ("what is the temperature in Berlin at 17:30", None),
+    ("will it rain in London at 9 o'clock", None),
+    ("humidity in Rome at 7 am tomorrow", None),
+    # more than one day
+    ("Will it rain in Berlin today or tomorrow", None),
+    ("Is it windy in Oslo on Monday or Tuesday?", None),
+    ("temperature in Berlin tonight and tomorrow", None),
+    # a span that is not a known place
+    ("What is the temperature in Narnia today?", None),
+]
+
+
+@pytest.mark.parametrize('question, expected', PARSE_CASES)
+def test_parse(parser, question, expected):
+    parsed = parser.parse(question, TODAY)
+    if expected is None:
+        assert parsed is None
+        return
+    labels, date, time, locations = expected
+    assert parsed['intent'] == 'get_weather' and parsed['complete']
+    assert (parsed['ontology_labels'], parsed['date'], parsed['time'], parsed['locations']) == \
+        (labels, date, time, locations)
+
+
+@pytest.mark.parametrize('question, intent', [
+    ("hi there", 'greeting'),
+    ("Thank you so much, all done good bye", 'goodbye'),
+])
+def test_parse_small_talk(parser, question, intent):
+    assert parser.parse(question, TODAY)['intent'] == intent
+
+
+@pytest.mark.parametrize('question, locations', [
+    ("compare Berlin and London temperature", ['Berlin', 'London']),
+    ("compare humidity between Paris and Rome", ['Paris', 'Rome']),
+    ("compare temperature in Berlin and London tomorrow", ['Berlin', 'London']),
+    ("weather in New York and Los Angeles", ['New York', 'Los Angeles']),
+    ("Is it windy in Berlin and what about tomorrow", ['Berlin']),
+    ("compare the humidity", []),
+])
+def test_extract_locations(parser, question, locations):
+    assert parser.extract_locations(question) == locations
@@ -0,0 +1,101 @@
+import time
+import asyncio
+
+import aiohttp
+import pytest
+from multidict import CIMultiDict
+from yarl import URL
+
+from resilience import CircuitBreaker, CircuitOpenError, Deadline, Upstream
+from weather_core import server_error
+
+
+WTTR_URL = URL('https://wttr.in/Berlin?format=j1')
+REQUEST = aiohttp.RequestInfo(WTTR_URL, 'GET', CIMultiDict(), WTTR_URL)
+
+
+def response_error(status):
+    return aiohttp.ClientResponseError(REQUEST, (), status=status, message='error')
+
+
+def weather_upstream(failure_threshold=5, reset_seconds=30):
+    return Upstream('weather', retry_on=(aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                                         aiohttp.ContentTypeError),
+                    retry_if=server_error, max_attempts=3, base_delay=0, max_delay=0,
+                    failure_threshold=failure_threshold, reset_seconds=reset_seconds)
+
+
+def failing(error, calls):
+    async def factory():
+        calls.append(1)
+        raise error
+    return factory
+
+
+def test_breaker_opens_half_opens_and_closes():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_seconds=0.05)
+    breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    time.sleep(0.06)
+    assert breaker.state == 'half_open'
+    # a single trial call goes through
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record_success()
+    assert breaker.state == 'closed'
+
+
+def test_failed_trial_opens_the_breaker_again():
+    breaker = CircuitBreaker('test', failure_threshold=1, reset_seconds=0.05)
+    breaker.record_failure()
+    time.sleep(0.06)
+    breaker.before_call()
+    breaker.record_failure()
+    assert breaker.state == 'open'
+
+
+@pytest.mark.parametrize('error', [response_error(503), response_error(500), aiohttp.ServerDisconnectedError(),
+                                   aiohttp.ContentTypeError(REQUEST, (), status=200, message='text/html'),
+                                   aiohttp.ClientPayloadError('truncated')])
+def test_transient_errors_are_retried(error):
+    upstream, calls = weather_upstream(), []
+    with pytest.raises(type(error)):
+        asyncio.run(upstream.call(failing(error, calls), Deadline(5)))
+    assert len(calls) == 3 and upstream.retries == 2
+    assert upstream.breaker.failures == 3
+
+
+@pytest.mark.parametrize('error', [response_error(404), ValueError('bad payload')])
+def test_other_errors_are_not_retried_and_do_not_reset_the_breaker(error):
+    upstream, calls = weather_upstream(), []
+    upstream.breaker.record_failure()
+    with pytest.raises(type(error)):
+        asyncio.run(upstream.call(failing(error, calls), Deadline(5)))
+    assert len(calls) == 1 and upstream.retries == 0
+    assert upstream.breaker.failures == 1
+
+
+def test_an_outage_opens_the_breaker():
+    upstream, calls = weather_upstream(failure_threshold=5), []
+    with pytest.raises(aiohttp.ClientResponseError):
+        asyncio.run(upstream.call(failing(response_error(503), calls), Deadline(5)))
+    # the fifth failure opens the breaker, the third attempt is not sent
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(upstream.call(failing(response_error(503), calls), Deadline(5)))
+    assert len(calls) == 5 and upstream.stats()['circuit'] == 'open'
+
+
+def test_a_real_response_closes_the_breaker():
+    upstream = weather_upstream(failure_threshold=1, reset_seconds=0.05)
+    upstream.breaker.record_failure()
+    time.sleep(0.06)
+
+    async def ok():
+        return 'forecast'
+    assert asyncio.run(upstream.call(ok, Deadline(5))) == 'forecast'
+    assert upstream.stats()['circuit'] == 'closed'
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from resilience import Deadline, DeadlineExceeded, SingleFlight
+from weather_core import BackgroundLoop
+
+
+@pytest.fixture(scope='module')
+def background_loop():
+    background_loop = BackgroundLoop(name='test-single-flight')
+    yield background_loop
+    background_loop.stop()
+
+
+def counting(calls, result=None, error=None, seconds=0.05):
+    async def factory():
+        calls.append(1)
+        await asyncio.sleep(seconds)
+        if error is not None:
+            raise error
+        return result
+    return factory
+
+
+def test_concurrent_callers_share_one_call(background_loop):
+    single_flight, calls = SingleFlight(background_loop), []
+
+    async def main():
+        return await asyncio.gather(*(single_flight.do(('weather', 'berlin'), counting(calls, 'forecast'))
+                                      for _ in range(5)))
+    assert asyncio.run(main()) == ['forecast'] * 5
+    assert len(calls) == 1
+    stats = single_flight.stats()['weather']
+    assert (stats['calls'], stats['coalesced'], stats['in_flight']) == (5, 4, 0)
+
+
+def test_different_keys_do_not_share(background_loop):
+    single_flight, calls = SingleFlight(background_loop), []
+
+    async def main():
+        return await asyncio.gather(single_flight.do(('weather', 'berlin'), counting(calls, 'berlin')),
+                                    single_flight.do(('weather', 'london'), counting(calls, 'london')))
+    assert asyncio.run(main()) == ['berlin', 'london']
+    assert len(calls) == 2
+
+
+def test_an_error_reaches_every_waiter_and_is_not_cached(background_loop):
+    single_flight, calls = SingleFlight(background_loop), []
+
+    async def main():
+        return await asyncio.gather(*(single_flight.do(('weather', 'berlin'), counting(calls, error=OSError('down')))
+                                      for _ in range(3)), return_exceptions=True)
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(isinstance(result, OSError) for result in results)
+    # the failed call is gone, the next caller tries again
+    assert asyncio.run(single_flight.do(('weather', 'berlin'), counting(calls, 'forecast'))) == 'forecast'
+    assert len(calls) == 2
+
+
+def test_a_waiter_past_its_deadline_leaves_the_call_running(background_loop):
+    single_flight, calls = SingleFlight(background_loop), []
+
+    async def main():
+        slow = counting(calls, 'forecast', seconds=0.2)
+        impatient = single_flight.do(('weather', 'berlin'), slow, Deadline(0.05))
+        patient = single_flight.do(('weather', 'berlin'), slow, Deadline(5))
+        return await asyncio.gather(impatient, patient, return_exceptions=True)
+    impatient, patient = asyncio.run(main())
+    assert isinstance(impatient, DeadlineExceeded)
+    assert patient == 'forecast' and len(calls) == 1
@@ -0,0 +1,72 @@
+from datetime import datetime
+
+import pytest
+
+from slot_filling import SLOT_QUESTIONS, missing_slot
+from weather_core import WeatherBot, get_query_tools, get_gazetteer
+
+# a Sunday
+TODAY = datetime(2026, 10, 18, 12, 0)
+EMPTY_STATE = {"ontology_labels": [], "intent": "", "date": "", "time": "", "location": "", "locations": [],
+               "complete": False, "aggregate": None, "response": ""}
+
+
+@pytest.fixture(scope='module')
+def slot_filler():
+    return get_query_tools(WeatherBot, 'gpt-4o', EMPTY_STATE)[3]
+
+
+def is_place(location):
+    return get_gazetteer().resolve(location) is not None
+
+
+def weather_state(**slots):
+    return dict(EMPTY_STATE, intent='get_weather', **slots)
+
+
+@pytest.mark.parametrize('state, slot', [
+    (weather_state(ontology_labels=[['general', 'temperature']], date='today'), 'location'),
+    (weather_state(location='Berlin', ontology_labels=[['general', 'temperature']]), 'date'),
+    (weather_state(location='Berlin', date='today'), 'ontology_labels'),
+    (weather_state(date='today'), 'location'),
+    (weather_state(location='Berlin', date='today', ontology_labels=[['general', 'temperature']]), None),
+    (weather_state(complete=True), None),
+    (dict(EMPTY_STATE, intent='greeting'), None),
+])
+def test_missing_slot(state, slot):
+    assert missing_slot(state) == slot
+
+
+@pytest.mark.parametrize('slot, answer, expected', [
+    ('location', "Berlin", {'location': 'Berlin', 'locations': ['Berlin']}),
+    ('location', "in Paris please", {'location': 'Paris', 'locations': ['Paris']}),
+    ('date', "tomorrow", {'date': 'tomorrow'}),
+    ('ontology_labels', "the humidity", {'ontology_labels': [['general', 'humidity']]}),
+    # not an answer, or an unknown place, is left to the model
+    ('location', "no idea", None),
+    ('location', "Springfield", None),
+])
+def test_parse(slot_filler, slot, answer, expected):
+    state = weather_state(date='today', ontology_labels=[['general', 'temperature']])
+    assert slot_filler.parse(slot, answer, state, TODAY, is_place) == expected
+
+
+def test_merge_asks_for_the_next_missing_slot(slot_filler):
+    state = slot_filler.merge(weather_state(ontology_labels=[['general', 'temperature']]),
+                              {'location': 'Berlin', 'locations': ['Berlin']})
+    assert not state['complete'] and state['response'] == SLOT_QUESTIONS['date']
+
+
+def test_merge_completes_the_query(slot_filler):
+    state = slot_filler.merge(weather_state(ontology_labels=[['general', 'temperature']], date='tomorrow'),
+                              {'location': 'Berlin'})
+    assert state['complete'] and state['locations'] == ['Berlin']
+    # a later day is answered from the hourly forecast at noon
+    assert state['ontology_labels'] == [['hourly', 'temperature']] and state['time'] == 'noon'
+    assert '{temperature}' in state['response'] and 'Berlin' in state['response']
+
+
+def test_merge_keeps_one_template_for_several_locations(slot_filler):
+    state = slot_filler.merge(weather_state(ontology_labels=[['general', 'temperature']], date='today'),
+                              {'location': 'Berlin', 'locations': ['Berlin', 'London']})
+    assert state['complete'] and '{location}' in state['response']
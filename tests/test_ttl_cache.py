@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from weather_core import TTLCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(time, 'monotonic', clock)
+    return clock
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = TTLCache(ttl_seconds=10, max_entries=4)
+    cache.put('berlin', 'forecast')
+    clock.now += 9
+    assert cache.get('berlin') == 'forecast'
+    clock.now += 1
+    assert cache.get('berlin') is None
+    assert cache.stats()['size'] == 0
+
+
+def test_a_stale_entry_is_only_served_through_get_stale(clock):
+    cache = TTLCache(ttl_seconds=10, max_entries=4, stale_seconds=5)
+    cache.put('berlin', 'forecast')
+    clock.now += 12
+    assert cache.get('berlin') is None
+    assert cache.get_stale('berlin') == 'forecast'
+    assert cache.expires_in('berlin') == -2
+    clock.now += 3
+    assert cache.get_stale('berlin') is None
+    assert cache.get('berlin') is None and cache.stats()['size'] == 0
+
+
+def test_put_takes_a_shorter_ttl(clock):
+    cache = TTLCache(ttl_seconds=10, max_entries=4)
+    cache.put('berlin', 'stored forecast', ttl_seconds=3)
+    assert cache.expires_in('berlin') == 3
+    clock.now += 3
+    assert cache.get('berlin') is None
+
+
+def test_the_least_recently_used_entry_is_evicted(clock):
+    cache = TTLCache(ttl_seconds=10, max_entries=2)
+    cache.put('berlin', 1)
+    cache.put('london', 2)
+    # a hit makes berlin the most recently used
+    assert cache.get('berlin') == 1
+    cache.put('paris', 3)
+    assert cache.get('london') is None
+    assert cache.get('berlin') == 1 and cache.get('paris') == 3
+    stats = cache.stats()
+    assert (stats['evictions'], stats['hits'], stats['misses']) == (1, 3, 1)